@@ -0,0 +1,110 @@
+"""Memory benchmark for the parsed corpus objects.
+
+Loads the corpus and reports, for Word, IPU, Turn and TurnTransition, how
+many instances were built and how much memory their instances take with
+``__slots__`` compared to the same attributes stored in a per-instance
+``__dict__``, as plain dataclasses do. Attribute values are shared between
+both layouts, so the comparison only covers the per-instance overhead.
+
+    python benchmark_memory.py [--local-path PATH]
+"""
+
+import argparse
+import logging
+import tracemalloc
+
+from games_corpus import SpanishGamesCorpusDialogues
+from games_corpus_types import IPU, Turn, TurnTransition, Word
+
+
+def collect_instances(corpus):
+    """Unique instances of each benchmarked class reachable from the corpus"""
+    instances = {cls: {} for cls in (Word, IPU, Turn, TurnTransition)}
+    for session in corpus.sessions.values():
+        for task in session.tasks:
+            for ipu in task.ipus:
+                instances[IPU][id(ipu)] = ipu
+                for word in ipu.words:
+                    instances[Word][id(word)] = word
+            for turn in task.turns:
+                instances[Turn][id(turn)] = turn
+            for transition in task.turn_transitions:
+                instances[TurnTransition][id(transition)] = transition
+    return {cls: list(objs.values()) for cls, objs in instances.items()}
+
+
+def slots_shell(obj):
+    shell = object.__new__(type(obj))
+    for name in type(obj).__slots__:
+        if hasattr(obj, name):
+            object.__setattr__(shell, name, getattr(obj, name))
+    return shell
+
+
+def dict_shell_factory(cls):
+    # One plain class per benchmarked class, so that instance dicts share
+    # their keys the way a regular dataclass's instances do
+    plain_cls = type(f"Plain{cls.__name__}", (), {})
+
+    def dict_shell(obj):
+        shell = plain_cls()
+        for name in cls.__slots__:
+            if hasattr(obj, name):
+                setattr(shell, name, getattr(obj, name))
+        return shell
+
+    return dict_shell
+
+
+def traced_bytes(make_shell, objs):
+    """Bytes allocated to build one shell per object"""
+    shells = [None] * len(objs)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for i, obj in enumerate(objs):
+        shells[i] = make_shell(obj)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return after - before
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--local-path", default=None)
+    args = parser.parse_args()
+
+    corpus = SpanishGamesCorpusDialogues()
+    tracemalloc.start()
+    corpus.load(local_path=args.local_path, load_audio=False)
+    load_current, load_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"Corpus load: {load_current / 2**20:.1f} MiB retained, "
+        f"{load_peak / 2**20:.1f} MiB peak\n"
+    )
+
+    total_slots = total_dict = 0
+    print(
+        f"{'class':16} {'instances':>10} {'__dict__ MiB':>13} "
+        f"{'__slots__ MiB':>14} {'saved':>7}"
+    )
+    for cls, objs in collect_instances(corpus).items():
+        if not objs:
+            continue
+        dict_bytes = traced_bytes(dict_shell_factory(cls), objs)
+        slots_bytes = traced_bytes(slots_shell, objs)
+        total_dict += dict_bytes
+        total_slots += slots_bytes
+        print(
+            f"{cls.__name__:16} {len(objs):>10} {dict_bytes / 2**20:>13.2f} "
+            f"{slots_bytes / 2**20:>14.2f} {1 - slots_bytes / dict_bytes:>7.0%}"
+        )
+    print(
+        f"{'total':16} {'':>10} {total_dict / 2**20:>13.2f} "
+        f"{total_slots / 2**20:>14.2f} {1 - total_slots / total_dict:>7.0%}"
+    )
+
+
+if __name__ == "__main__":
+    logging.getLogger().setLevel(logging.WARNING)
+    main()
@@ -177,9 +177,9 @@ def plot_stereo_audio_and_transitions(
 
 
 def main():
-    # Initialize and load the corpus with audio
+    # Initialize and load the corpus, fetching only the audio of the tasks used
     corpus = SpanishGamesCorpusDialogues()
-    corpus.load(load_audio=True)
+    corpus.load(load_audio="on_demand")
 
     # Get the first development task from batch 1
     task = next(corpus.dev_tasks(batch=1))
@@ -196,13 +196,10 @@ def main():
         print(f"\nProcessing audio for speaker {speaker}")
         print(f"Audio file: {wav_path}")
 
-        # Load the audio file
-        y, sr = librosa.load(wav_path)
-
-        # Get audio segment for this specific task
-        start_sample = int(task.start * sr)
-        end_sample = int((task.start + task.duration) * sr)
-        y_task = y[start_sample:end_sample]
+        # Read only this task's segment of the audio file, at librosa's
+        # default sample rate
+        sr = 22050
+        y_task = task.audio(speaker, sr=sr)
 
         # Extract some basic features
         mfccs = librosa.feature.mfcc(y=y_task, sr=sr, n_mfcc=13)
@@ -1,16 +1,25 @@
 """Games corpus library."""
 
+import functools
+import hashlib
+import itertools
+import json
 import logging
 from pathlib import Path
 import os
+import pickle
+import threading
 import zipfile
 import requests
 import pandas as pd
 import time
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from dataclasses import dataclass, field
-from typing import Dict, Set
+from typing import Callable, Dict, Iterable, List, Optional, Set
+import games_corpus_audio
 import games_corpus_parsers
-from games_corpus_types import Task, Session, BatchConfig
+from games_corpus_types import Task, Session, BatchConfig, Registry, IPU, Turn
 
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
@@ -29,9 +38,24 @@ class CorpusInfo:
     age_range: str = "19-59 years"
 
 
+@dataclass(frozen=True)
+class FileChecksum:
+    """Expected size in bytes and SHA-256 hex digest of a corpus file."""
+
+    size: int
+    sha256: str
+
+
 @dataclass(frozen=True)
 class CorpusFiles:
-    """Mapping of corpus file identifiers to their filenames."""
+    """Mapping of corpus file identifiers to their filenames.
+
+    ``checksums`` maps filenames to their known-good ``FileChecksum``. The
+    corpus publisher does not provide any, so it is empty by default and
+    downloads are only checked for completeness: they must deliver their
+    announced length and archives must open. Fill it in to also check the
+    files against known hashes.
+    """
 
     files: Dict[str, str] = field(
         default_factory=lambda: {
@@ -48,6 +72,23 @@ class CorpusFiles:
             "subjects-info": "subjects-info.csv",
         }
     )
+    checksums: Dict[str, FileChecksum] = field(default_factory=dict)
+    # Published with the corpus but never read: batch 1 IPUs are built from
+    # the words files. These are not downloaded.
+    unparsed: Set[str] = field(default_factory=lambda: {"b1-dialogue-phrases"})
+
+    @staticmethod
+    def batch(file_id: str) -> Optional[int]:
+        """Batch of an archive, or None for the files shared by both batches"""
+        if file_id.startswith(("b1-", "b2-")):
+            return int(file_id[1])
+        return None
+
+    @staticmethod
+    def tier(file_id: str) -> Optional[str]:
+        """Data tier an archive is needed for, or None if always needed"""
+        kind = file_id.rsplit("-", 1)[-1]
+        return {"phrases": "ipus", "words": "ipus", "turns": "turns"}.get(kind)
 
 
 class CorpusConfig:
@@ -57,61 +98,317 @@ class CorpusConfig:
     CORPUS_FILES: CorpusFiles = CorpusFiles()
     DEFAULT_URL: str = "https://ri.conicet.gov.ar/bitstream/handle/11336/191235/{filename}?sequence=29&isAllowed=y"
     BANNED_SESSIONS: Set[int] = {28}
+    # Bump whenever the parsed object layout changes, to invalidate caches
+    CACHE_VERSION: int = 7
+    CACHE_FILE_NAME: str = "parsed-corpus.pkl"
+    FEATURE_STORE_DIR: str = "features"
+    FEATURE_STORE_MAX_BYTES: int = 20 * 2**30
+    VERIFIED_DOWNLOADS_FILE_NAME: str = "verified-downloads.json"
+    # Data tiers that can be selected in load(), and the tiers each one needs
+    TIERS: Dict[str, Set[str]] = {
+        "ipus": set(),
+        "turns": {"ipus"},
+        "transitions": {"turns", "ipus"},
+    }
+
+
+def sha256_file(path: Path, chunk_size: int = 1 << 20) -> str:
+    """SHA-256 hex digest of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
 
 
 class CorpusDownloader:
-    """Handles downloading and extracting corpus files"""
+    """Handles downloading and extracting corpus files
+
+    Files are streamed in chunks to a ``.part`` file next to their
+    destination, which is renamed into place once complete. An interrupted
+    download resumes from the ``.part`` file with an HTTP Range request.
+    Several files are fetched at once over a shared ``requests.Session``.
+
+    Downloads are checked for completeness, and against ``checksums`` for
+    the files listed there. The files that pass, and the archives found
+    completely extracted, are recorded in ``record_file`` with their size,
+    modification time and the SHA-256 computed while downloading. The
+    record only shows that a file is unchanged since it was downloaded and
+    checked, so later runs skip checking it again; it says nothing about a
+    file without a known checksum matching the published one. Files that
+    fail the checks are downloaded again.
+    """
+
+    PART_SUFFIX = ".part"
 
     def __init__(
-        self, url: str, local_path: Path, max_retries: int = 3, retry_delay: int = 5
+        self,
+        url: str,
+        local_path: Path,
+        max_retries: int = 3,
+        retry_delay: int = 5,
+        max_workers: int = 4,
+        chunk_size: int = 1 << 20,
+        checksums: Optional[Dict[str, FileChecksum]] = None,
+        record_file: str = CorpusConfig.VERIFIED_DOWNLOADS_FILE_NAME,
     ):
         self.url = url
         self.local_path = local_path
         self.max_retries = max_retries
         self.retry_delay = retry_delay
+        self.max_workers = max_workers
+        self.chunk_size = chunk_size
+        self.checksums = checksums or {}
+        self.record_path = local_path / record_file
+        self._verified = self._read_verified()
+        self._verified_lock = threading.Lock()
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
 
-    def download_corpus(self, files_to_download: dict):
-        """Download all corpus files"""
-        for file_id, file_name in files_to_download.items():
-            if ".zip" in file_name:
-                self._download_and_extract_zip(file_id, file_name)
-            else:
-                self._download_file(file_name)
+    def __getstate__(self):
+        # The downloader is pickled along with the corpus for parse workers
+        state = self.__dict__.copy()
+        del state["_verified_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._verified_lock = threading.Lock()
+
+    def download_corpus(
+        self, files_to_download: dict, keep_zipped: Iterable[str] = ()
+    ):
+        """Download all corpus files
+
+        Archives are extracted next to the downloaded file, except for those
+        whose file ID is in ``keep_zipped``.
+        """
+        unlisted = [
+            name for name in files_to_download.values() if name not in self.checksums
+        ]
+        if unlisted:
+            logging.info(
+                f"No known checksums for {len(unlisted)} files; they are only "
+                "checked for completeness."
+            )
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [
+                executor.submit(self._fetch, file_id, file_name, keep_zipped)
+                for file_id, file_name in files_to_download.items()
+            ]
+            for future in futures:
+                future.result()
+
+    def _fetch(self, file_id: str, file_name: str, keep_zipped: Iterable[str]):
+        if ".zip" in file_name and file_id not in keep_zipped:
+            self._download_and_extract_zip(file_id, file_name)
+        else:
+            self._download_file(file_name)
 
     def _download_and_extract_zip(self, file_id: str, file_name: str):
         zip_file_path = self.local_path / file_name
         extracted_folder_path = self.local_path / file_id
 
         if extracted_folder_path.exists():
-            logging.info(f"{file_name} already downloaded.")
-            return
+            record = self._verified.get(file_name, {})
+            if not zip_file_path.exists():
+                # Nothing to check the folder against
+                if not record.get("extracted"):
+                    logging.info(f"Using {file_id} without its archive.")
+                return
+            if record.get("extracted") and self._is_recorded(zip_file_path):
+                logging.info(f"{file_name} already downloaded.")
+                return
 
-        if not zip_file_path.exists():
-            self._download_file(file_name, zip_file_path)
+        self._download_file(file_name, zip_file_path)
 
-        logging.info(f"Extracting {file_name}...")
+        if extracted_folder_path.exists() and self._is_extracted(zip_file_path):
+            logging.info(f"{file_name} already extracted.")
+        else:
+            logging.info(f"Extracting {file_name}...")
+            with zipfile.ZipFile(zip_file_path, "r") as zip_ref:
+                zip_ref.extractall(self.local_path)
+        self._record(zip_file_path, extracted=True)
+
+    def _is_extracted(self, zip_file_path: Path) -> bool:
+        """Whether every file of the archive exists with its full size"""
         with zipfile.ZipFile(zip_file_path, "r") as zip_ref:
-            zip_ref.extractall(self.local_path)
+            for member in zip_ref.infolist():
+                if member.is_dir():
+                    continue
+                path = self.local_path / member.filename
+                if not path.is_file() or path.stat().st_size != member.file_size:
+                    logging.warning(f"Incomplete extraction of {zip_file_path.name}")
+                    return False
+        return True
 
     def _download_file(self, file_name: str, save_path: Path = None):
         save_path = save_path or self.local_path / file_name
         if save_path.exists():
-            logging.info(f"{file_name} already exists.")
-            return
+            if self._is_intact(save_path):
+                logging.info(f"{file_name} already exists.")
+                return
+            logging.warning(f"{file_name} is corrupt, downloading it again.")
+            save_path.unlink()
 
+        part_path = save_path.with_name(save_path.name + self.PART_SUFFIX)
         for attempt in range(self.max_retries):
             try:
                 logging.info(f"Downloading {file_name} (attempt {attempt + 1})...")
-                response = requests.get(self.url.format(filename=file_name), timeout=30)
-                response.raise_for_status()
-                with open(save_path, "wb") as f:
-                    f.write(response.content)
+                url = self.url.format(filename=file_name)
+                sha256 = self._stream_to(url, part_path)
+                try:
+                    self._check(file_name, part_path, sha256)
+                except IOError:
+                    # Resuming a corrupt file cannot fix it; start over
+                    part_path.unlink()
+                    raise
+                os.replace(part_path, save_path)
+                self._record(save_path, sha256=sha256)
                 return
             except (requests.RequestException, IOError) as e:
                 if attempt == self.max_retries - 1:
                     raise RuntimeError(f"Failed to download {file_name}: {e}")
                 time.sleep(self.retry_delay)
 
+    def _stream_to(self, url: str, part_path: Path) -> str:
+        """Append the rest of ``url`` to ``part_path``, resuming if possible.
+
+        Returns the SHA-256 hex digest of the complete file.
+        """
+        offset = part_path.stat().st_size if part_path.exists() else 0
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        response = self.session.get(url, headers=headers, stream=True, timeout=30)
+        with response:
+            if offset and response.status_code == 416:
+                # The partial file does not match the remote one; start over
+                part_path.unlink()
+                raise IOError(f"Cannot resume {part_path.name} at byte {offset}")
+            response.raise_for_status()
+            if response.status_code != 206:
+                # The server sent the whole file
+                offset = 0
+            digest = hashlib.sha256()
+            if offset:
+                with open(part_path, "rb") as f:
+                    for chunk in iter(lambda: f.read(self.chunk_size), b""):
+                        digest.update(chunk)
+            # A connection dropped before Content-Length bytes arrived raises a
+            # RequestException, keeping what was written for the next attempt
+            with open(part_path, "ab" if offset else "wb") as f:
+                for chunk in response.iter_content(chunk_size=self.chunk_size):
+                    f.write(chunk)
+                    digest.update(chunk)
+        return digest.hexdigest()
+
+    def _check(self, file_name: str, path: Path, sha256: str):
+        """Raise IOError if ``path`` is an incomplete or mismatching ``file_name``"""
+        expected = self.checksums.get(file_name)
+        if expected and (
+            path.stat().st_size != expected.size or sha256 != expected.sha256
+        ):
+            raise IOError(f"Checksum mismatch for {file_name}")
+        if file_name.endswith(".zip") and not zipfile.is_zipfile(path):
+            raise IOError(f"{file_name} is not a complete ZIP archive")
+
+    def _is_intact(self, path: Path) -> bool:
+        if self._is_recorded(path):
+            return True
+        sha256 = sha256_file(path, self.chunk_size)
+        try:
+            self._check(path.name, path, sha256)
+        except IOError as e:
+            logging.warning(str(e))
+            return False
+        self._record(path, sha256=sha256)
+        return True
+
+    def _is_recorded(self, path: Path) -> bool:
+        """Whether ``path`` was checked and has not changed since"""
+        record = self._verified.get(path.name)
+        if not record or not path.exists():
+            return False
+        stat = path.stat()
+        return (record["size"], record["mtime_ns"]) == (stat.st_size, stat.st_mtime_ns)
+
+    def _read_verified(self) -> dict:
+        try:
+            with open(self.record_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except ValueError as e:
+            logging.warning(f"Ignoring unreadable {self.record_path}: {e}")
+            return {}
+
+    def _record(self, path: Path, **fields):
+        stat = path.stat()
+        with self._verified_lock:
+            record = self._verified.get(path.name, {})
+            if (record.get("size"), record.get("mtime_ns")) != (
+                stat.st_size,
+                stat.st_mtime_ns,
+            ):
+                record = {}
+            record.update(fields, size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+            self._verified[path.name] = record
+            tmp_path = self.record_path.with_suffix(".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._verified, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.record_path)
+
+
+def attach_audio_archives(session, audio_archives: dict):
+    """Attach the on-demand wavs of ``session`` to the corpus's archives"""
+    for task in session.tasks:
+        if isinstance(task.wavs, games_corpus_audio.LazyWavs):
+            task.wavs.attach(audio_archives)
+
+
+def _session_features(store, extractor, session, units, audio_archives):
+    # Runs in a worker process, where the session arrives without archives
+    attach_audio_archives(session, audio_archives)
+    return store.session_features(extractor, session, units)
+
+
+class LazySessions(Mapping):
+    """Read-only mapping of session IDs to sessions that are parsed on access.
+
+    Sessions are indexed from sessions-info up front; each one is parsed the
+    first time it is looked up and kept for later lookups.
+    """
+
+    def __init__(self, sessions_info: Iterable[tuple], load_session: Callable):
+        self._sessions_info = {info[0]: info for info in sessions_info}
+        self._load_session = load_session
+        self._loaded = {}
+
+    def __getitem__(self, session_id):
+        if session_id not in self._loaded:
+            session_info = self._sessions_info[session_id]
+            self._loaded[session_id] = self._load_session(session_info)
+        return self._loaded[session_id]
+
+    def __iter__(self):
+        return iter(self._sessions_info)
+
+    def __len__(self):
+        return len(self._sessions_info)
+
+    @property
+    def loaded_session_ids(self):
+        """IDs of the sessions parsed so far"""
+        return list(self._loaded)
+
+    def by_batch(self, batch: int) -> "LazySessions":
+        """Sessions of a batch, sharing the parsed sessions with this mapping"""
+        return LazySessions(
+            (info for info in self._sessions_info.values() if info[1] == batch),
+            lambda session_info: self[session_info[0]],
+        )
+
 
 class SpanishGamesCorpusDialogues:
     """
@@ -122,7 +419,20 @@ class SpanishGamesCorpusDialogues:
     def __init__(self):
         self.corpus_raw = None
         self.sessions = None
+        self.registry = Registry()
+        self.columnar = False
+        self.vocabulary = None
+        self.from_zip = False
+        self.audio_archives = {}
+        # (sample rate, dtype) to the resampled copy of each wav
+        self.resampled_wavs: Dict[tuple, Dict[Path, Path]] = {}
+        # Archives read without extracting them, kept open while loaded
+        self.zip_archives: Set[Path] = set()
+        self._feature_store = None
         self.config = CorpusConfig()
+        self.batches = None
+        self.session_ids = None
+        self.tiers = set(self.config.TIERS)
         self.corpus_url = self.config.DEFAULT_URL
         self.corpus_local_path = None
         self.corpus_files = self.config.CORPUS_FILES.files.copy()
@@ -158,13 +468,70 @@ class SpanishGamesCorpusDialogues:
             )
         return self.batch_configs[batch]
 
-    def load(self, url=None, load_audio=False, local_path=None):
-        """Load the corpus from a URL or local path."""
+    def load(
+        self,
+        url=None,
+        load_audio=False,
+        local_path=None,
+        workers=None,
+        use_cache=False,
+        lazy=False,
+        columnar=False,
+        from_zip=False,
+        batches=None,
+        sessions=None,
+        tiers=None,
+    ):
+        """Load the corpus from a URL or local path.
+
+        Args:
+            url: Optional URL template to download the corpus files from
+            load_audio: Whether to download the audio files, or "on_demand" to
+                only fetch the wav files of a task once its ``wavs`` are read
+                (see ``games_corpus_audio.AudioArchive``)
+            local_path: Optional local folder for the corpus files
+            workers: Number of processes used to parse sessions. Sessions are
+                parsed serially when not given or lower than 2.
+            use_cache: Reuse the parsed sessions stored in the local folder
+                when the annotation files have not changed since they were
+                stored, and store them after parsing otherwise.
+            lazy: Only index the sessions, and parse each one the first time it
+                is accessed. ``workers`` and ``use_cache`` are ignored, and
+                IPUs and turns are only registered once their session is parsed.
+            columnar: Store each task's words, IPUs, turns and transitions in
+                NumPy arrays, with ``ipus``, ``turns`` and ``turn_transitions``
+                as views over them (see ``games_corpus_columnar``). Requires
+                NumPy. Views are not registered.
+            from_zip: Read the annotation files straight from the downloaded
+                archives instead of extracting them. Audio archives are still
+                extracted.
+            batches: Only download and load these batches. All when None.
+            sessions: Only load these session IDs. All when None.
+            tiers: Only parse these data tiers, out of "ipus", "turns" and
+                "transitions", along with the tiers they are built from. Tasks
+                are always loaded, and the lists of tiers that are not loaded
+                are left empty. All tiers when None.
+        """
         self._setup_paths(url, local_path)
-        self._filter_audio_files(load_audio)
-        self.downloader = CorpusDownloader(self.corpus_url, self.corpus_local_path)
-        self.downloader.download_corpus(self.corpus_files)
-        self._prepare_corpus_data()
+        self._setup_columnar(columnar)
+        self._setup_selection(batches, sessions, tiers)
+        self.downloader = CorpusDownloader(
+            self.corpus_url,
+            self.corpus_local_path,
+            checksums=self.config.CORPUS_FILES.checksums,
+        )
+        self._narrow_batches_to_sessions()
+        self._filter_selected_files()
+        audio_files = self._filter_audio_files(load_audio)
+        self.from_zip = from_zip
+        self.audio_archives = {
+            file_id: games_corpus_audio.AudioArchive(self.downloader, file_id, name)
+            for file_id, name in audio_files.items()
+        }
+        self.downloader.download_corpus(
+            self.corpus_files, keep_zipped=self._zipped_file_ids()
+        )
+        self._prepare_corpus_data(workers, use_cache, lazy)
 
     def _setup_paths(self, url=None, local_path=None):
         """Configure corpus URLs and paths."""
@@ -176,23 +543,401 @@ class SpanishGamesCorpusDialogues:
         )
         self.corpus_local_path.mkdir(parents=True, exist_ok=True)
 
+    def _setup_columnar(self, columnar):
+        self.columnar = columnar
+        self.vocabulary = None
+        if columnar:
+            # NumPy is only needed for the columnar storage
+            import games_corpus_columnar
+
+            self.vocabulary = games_corpus_columnar.Vocabulary()
+
+    def _adopt_columns(self, session):
+        # Columns parsed in another process or read from the cache come with
+        # their own copy of the vocabulary
+        for task in session.tasks:
+            if task.columns is not None:
+                task.columns.use_vocabulary(self.vocabulary)
+
+    def _adopt_audio_archives(self, session):
+        # On-demand wavs parsed in another process or read from the cache
+        # come without their archive
+        attach_audio_archives(session, self.audio_archives)
+
+    def _zipped_file_ids(self) -> Set[str]:
+        """IDs of the archives that are read without extracting them"""
+        if not self.from_zip:
+            return set()
+        return {
+            file_id
+            for file_id, file_name in self.corpus_files.items()
+            if file_name.endswith(".zip") and not file_id.endswith("-wavs")
+        }
+
+    def _setup_selection(self, batches=None, sessions=None, tiers=None):
+        if batches is not None:
+            for batch in batches:
+                self.get_batch_config(batch)
+            batches = set(batches)
+        if tiers is None:
+            tiers = set(self.config.TIERS)
+        else:
+            unknown = set(tiers) - set(self.config.TIERS)
+            if unknown:
+                raise ValueError(
+                    f"Invalid tiers: {sorted(unknown)}. Available tiers are: "
+                    f"{list(self.config.TIERS)}"
+                )
+            tiers = set(tiers).union(*(self.config.TIERS[tier] for tier in tiers))
+        self.batches = batches
+        self.session_ids = set(sessions) if sessions is not None else None
+        self.tiers = tiers
+
+    def _narrow_batches_to_sessions(self):
+        """Only select the batches of the selected sessions.
+
+        sessions-info is downloaded first to find them, so that the archives
+        of the other batches are not downloaded.
+        """
+        if self.session_ids is None:
+            return
+        file_name = self.config.CORPUS_FILES.files["sessions-info"]
+        self.downloader.download_corpus({"sessions-info": file_name})
+        sessions_info = pd.read_csv(self.corpus_local_path / file_name)
+        selected = sessions_info[sessions_info.session_id.isin(self.session_ids)]
+        batches = {int(batch) for batch in selected.batch}
+        self.batches = batches if self.batches is None else self.batches & batches
+
+    def _filter_selected_files(self):
+        """Select the files of the loaded batches and tiers.
+
+        Starts from every corpus file on each load, so that reloading with a
+        wider selection brings back the files a previous load left out.
+        """
+        files = self.config.CORPUS_FILES
+        self.corpus_files = {
+            file_id: file_name
+            for file_id, file_name in files.files.items()
+            if file_id not in files.unparsed
+            and (self.batches is None or files.batch(file_id) in (None, *self.batches))
+            and files.tier(file_id) in (None, *self.tiers)
+        }
+
     def _filter_audio_files(self, load_audio):
-        """Remove audio files from corpus_files if not loading audio."""
-        if not load_audio:
+        """Remove audio files from corpus_files if not loading audio up front.
+
+        Returns the audio files to fetch on demand.
+        """
+        if load_audio not in (False, True, "on_demand"):
+            raise ValueError(
+                f"Invalid load_audio: {load_audio!r}. Use True, False or 'on_demand'"
+            )
+        audio_files = {
+            k: v for k, v in self.corpus_files.items() if k.endswith("-wavs")
+        }
+        if load_audio is not True:
             self.corpus_files = {
-                k: v for k, v in self.corpus_files.items() if not k.endswith("-wavs")
+                k: v for k, v in self.corpus_files.items() if k not in audio_files
             }
+        return audio_files if load_audio == "on_demand" else {}
 
-    def _prepare_corpus_data(self):
+    def _prepare_corpus_data(self, workers=None, use_cache=False, lazy=False):
         """Load and parse corpus data."""
+        # Start from an empty registry, so that reloading frees the objects of
+        # the previous load once nothing else refers to them
+        self.close_archives()
+        self.registry = Registry()
+        Registry.set_default(self.registry)
         try:
             self._load_raw_corpus()
-            self._parse_corpus()
+            if lazy:
+                self.sessions = LazySessions(self._sessions_info(), self._load_session)
+                return
+            if use_cache and self._load_cached_sessions():
+                return
+            self._parse_corpus(workers)
+            if use_cache:
+                self._save_cached_sessions()
         except Exception as e:
             raise RuntimeError(f"Failed to prepare corpus data: {e}")
 
+    def close_archives(self):
+        """Close the archives read by ``load(from_zip=True)``.
+
+        Sessions parsed afterwards, as with ``lazy``, open them again.
+        """
+        games_corpus_parsers.close_archives(self.zip_archives)
+        self.zip_archives = set()
+
+    @property
+    def cache_path(self) -> Path:
+        return self.corpus_local_path / self.config.CACHE_FILE_NAME
+
+    def _cache_key(self):
+        """Identify the parsed corpus by its source files and the cache version."""
+        files = []
+        zipped = self._zipped_file_ids()
+        for file_id, file_name in sorted(self.corpus_files.items()):
+            if file_name.endswith(".zip") and file_id not in zipped:
+                paths = sorted(self.corpus_raw[file_id].values())
+            else:
+                paths = [self.corpus_local_path / file_name]
+            for path in paths:
+                stat = os.stat(path)
+                files.append((file_id, path.name, stat.st_size, stat.st_mtime_ns))
+        return (
+            self.config.CACHE_VERSION,
+            self.columnar,
+            tuple(sorted(self.config.BANNED_SESSIONS)),
+            tuple(sorted(self.batches)) if self.batches is not None else None,
+            tuple(sorted(self.session_ids)) if self.session_ids is not None else None,
+            tuple(sorted(self.tiers)),
+            tuple(sorted(self.audio_archives)),
+            tuple(files),
+        )
+
+    def _load_cached_sessions(self) -> bool:
+        if not self.cache_path.exists():
+            return False
+        try:
+            with open(self.cache_path, "rb") as f:
+                # The key is a record of its own, so that the sessions are
+                # only unpickled when it matches
+                if pickle.load(f) != self._cache_key():
+                    logging.info("Parsed corpus cache is out of date.")
+                    return False
+                logging.info(f"Loading parsed corpus from {self.cache_path}")
+                sessions = pickle.load(f)
+        except Exception as e:
+            logging.warning(f"Ignoring unreadable cache {self.cache_path}: {e}")
+            return False
+
+        self.sessions = sessions
+        for session in self.sessions.values():
+            session.register(self.registry)
+            self._adopt_columns(session)
+            self._adopt_audio_archives(session)
+        return True
+
+    def _save_cached_sessions(self):
+        # Write to a temporary file first so that an interrupted write never
+        # leaves a truncated cache behind
+        tmp_path = self.cache_path.with_suffix(".tmp")
+        with open(tmp_path, "wb") as f:
+            pickle.dump(self._cache_key(), f, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(self.sessions, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.cache_path)
+        logging.info(f"Stored parsed corpus in {self.cache_path}")
+
+    def get_ipu_by_id(self, ipu_id: str) -> Optional[IPU]:
+        return self.registry.get_ipu_by_id(ipu_id)
+
+    def get_turn_by_id(self, turn_id: str) -> Optional[Turn]:
+        return self.registry.get_turn_by_id(turn_id)
+
+    def get_session_by_id(self, session_id: int) -> Optional[Session]:
+        return self.registry.get_session_by_id(session_id)
+
+    @property
+    def feature_store(self):
+        """Store used by ``extract_features``, under the local folder by default"""
+        if self._feature_store is None:
+            # NumPy is only needed for audio features
+            import games_corpus_features
+
+            self._feature_store = games_corpus_features.FeatureStore(
+                self.corpus_local_path / self.config.FEATURE_STORE_DIR,
+                max_bytes=self.config.FEATURE_STORE_MAX_BYTES,
+            )
+        return self._feature_store
+
+    @feature_store.setter
+    def feature_store(self, store):
+        self._feature_store = store
+
+    def extract_features(
+        self, extractor, units: str = "ipu", batch: int = None, workers: int = None
+    ):
+        """Yield ``(unit, features)`` for each IPU or turn of the loaded sessions.
+
+        Features are read from ``feature_store`` when already stored, and
+        computed and stored otherwise. Units are yielded in session, task and
+        unit order, also when extracting in parallel.
+
+        Args:
+            extractor: A ``games_corpus_features.FeatureExtractor``
+            units: "ipu" or "turn"
+            batch: Only extract features of this batch. All batches when None.
+            workers: Number of processes extracting features, one session at a
+                time each. Features are extracted in this process when None.
+        """
+        sessions = (
+            self.get_sessions_by_batch(batch) if batch is not None else self.sessions
+        )
+        session_features = self.feature_store.session_features
+        if workers and workers > 1:
+            executor = ProcessPoolExecutor(max_workers=workers)
+            try:
+                # Results come back in submission order as sessions finish
+                features_by_session = executor.map(
+                    _session_features,
+                    itertools.repeat(self.feature_store),
+                    itertools.repeat(extractor),
+                    sessions.values(),
+                    itertools.repeat(units),
+                    itertools.repeat(self.audio_archives),
+                )
+                for session, features in zip(sessions.values(), features_by_session):
+                    yield from self._zip_units(session, units, features)
+            finally:
+                # Sessions not started yet are dropped when iteration stops early
+                executor.shutdown(wait=True, cancel_futures=True)
+        else:
+            for session in sessions.values():
+                features = session_features(extractor, session, units)
+                yield from self._zip_units(session, units, features)
+
+    def resample_audio(self, sr: int, dtype: str = "int16", workers: int = None):
+        """Make the wavs of the loaded tasks readable at ``sr`` without resampling.
+
+        Each wav is resampled once, to a memory-mappable copy under the local
+        corpus folder that is reused by later runs. Segment reads at ``sr``
+        find the copy on disk and read it, the float32 one when there are
+        both. Returns each wav path mapped to its copy, which is also kept in
+        ``resampled_wavs``.
+
+        Args:
+            sr: Sample rate of the copies
+            dtype: "int16" for compact copies, "float32" for exact ones
+            workers: Number of processes resampling files. Files are
+                resampled in this process when None.
+        """
+        wav_paths = sorted(
+            {
+                Path(path)
+                for session in self.sessions.values()
+                for task in session.tasks
+                for path in task.wavs.values()
+            }
+        )
+        resample = functools.partial(
+            games_corpus_audio.resample_wav,
+            sr=sr,
+            dtype=dtype,
+        )
+        if workers and workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                copies = list(executor.map(resample, wav_paths))
+        else:
+            copies = [resample(path) for path in wav_paths]
+        resampled = dict(zip(wav_paths, copies))
+        self.resampled_wavs[sr, dtype] = resampled
+        return resampled
+
+    def audio_batches(
+        self,
+        sr: int,
+        units: str = "ipu",
+        batch: int = None,
+        split: str = None,
+        **options,
+    ):
+        """Yield padded ``games_corpus_audio.AudioBatch``es of IPUs or turns.
+
+        Units of similar duration are batched together, and batches are read
+        ahead on background threads; see ``games_corpus_audio.audio_batches``
+        for the ``options``.
+
+        Args:
+            sr: Sample rate of the batches
+            units: "ipu" or "turn"
+            batch: Only use units of this batch. All batches when None.
+            split: "dev" or "held_out" to only use units of that split. All
+                units when None.
+        """
+        if units not in ("ipu", "turn"):
+            raise ValueError(
+                f"Invalid units: {units}. Available units are: ['ipu', 'turn']"
+            )
+        selected = []
+        for task in self._loaded_tasks(batch, split):
+            selected.extend(task.ipus if units == "ipu" else task.turns)
+        return games_corpus_audio.audio_batches(selected, sr, **options)
+
+    def transition_windows(
+        self,
+        before: float = 2.0,
+        after: float = 1.0,
+        sr: int = None,
+        batch: int = None,
+        split: str = None,
+    ):
+        """Audio of both channels around the turn transitions of loaded tasks.
+
+        See ``games_corpus_audio.transition_windows`` for the windows.
+
+        Args:
+            before: Seconds of each window before the end of ``ipu_from``
+            after: Seconds of each window from the start of ``ipu_to``
+            sr: Sample rate of the windows, which needs the wavs resampled by
+                ``resample_audio``. The rate of the wavs when None.
+            batch: Only use transitions of this batch. All batches when None.
+            split: "dev" or "held_out" to only use transitions of that split.
+                All transitions when None.
+        """
+        return games_corpus_audio.transition_windows(
+            self._loaded_tasks(batch, split), before, after, sr
+        )
+
+    def vad_matrices(
+        self, frame_hz: float = 50, batch: int = None, split: str = None
+    ) -> List[tuple]:
+        """``(task, Task.vad_matrix(frame_hz))`` for each loaded task.
+
+        The matrices not cached yet are computed in one vectorized pass; see
+        ``games_corpus_columnar.vad_matrices``.
+
+        Args:
+            frame_hz: Frames per second
+            batch: Only use tasks of this batch. All batches when None.
+            split: "dev" or "held_out" to only use tasks of that split. All
+                tasks when None.
+        """
+        # NumPy is only needed for voice activity
+        import games_corpus_columnar
+
+        tasks = self._loaded_tasks(batch, split)
+        return list(zip(tasks, games_corpus_columnar.vad_matrices(tasks, frame_hz)))
+
+    def _loaded_tasks(self, batch=None, split=None) -> List[Task]:
+        # Tasks of the loaded sessions in a batch and split, all when None
+        if split not in (None, "dev", "held_out"):
+            raise ValueError(
+                f"Invalid split: {split}. Available splits are: ['dev', 'held_out']"
+            )
+        sessions = (
+            self.get_sessions_by_batch(batch) if batch is not None else self.sessions
+        )
+        tasks = []
+        for session in sessions.values():
+            config = self.get_batch_config(session.batch)
+            for task in session.tasks:
+                if split is None or (split == "held_out") == config.is_heldout(
+                    session.session_id, task.task_id
+                ):
+                    tasks.append(task)
+        return tasks
+
+    @staticmethod
+    def _zip_units(session, units, features_by_task):
+        for task, features in zip(session.tasks, features_by_task):
+            units_of_task = task.ipus if units == "ipu" else task.turns
+            yield from zip(units_of_task, features)
+
     def get_sessions_by_batch(self, batch):
         """Get all sessions for a specific batch"""
+        if isinstance(self.sessions, LazySessions):
+            return self.sessions.by_batch(batch)
         return {
             sid: session
             for sid, session in self.sessions.items()
@@ -204,10 +949,10 @@ class SpanishGamesCorpusDialogues:
         batch_sessions = self.get_sessions_by_batch(batch)
         config = self.get_batch_config(batch)
 
-        for sess_id, sess in batch_sessions.items():
+        for sess_id in batch_sessions:
             if config.is_heldout_session(sess_id):
                 continue
-            for task in sess.tasks:
+            for task in batch_sessions[sess_id].tasks:
                 if config.is_heldout_task(task.session_id, task.task_id):
                     continue
                 yield task
@@ -226,14 +971,57 @@ class SpanishGamesCorpusDialogues:
                     if config.is_heldout_task(sess_id, task.task_id):
                         yield task
 
+    def iter_tasks(self, batch: int = None, split: str = None):
+        """Parse and yield tasks one at a time, without keeping them.
+
+        Tasks are not added to ``self.sessions``, and their IPUs and turns
+        are registered in a throwaway registry per session instead of the
+        corpus's, so that nothing keeps them alive once dropped and the
+        objects of loaded sessions stay registered. Use after
+        ``load(lazy=True)`` so that nothing is parsed up front.
+
+        Args:
+            batch: Only yield tasks from this batch. All batches when None.
+            split: "dev" or "held_out" to only yield tasks of that split. All
+                tasks when None.
+        """
+        if split not in (None, "dev", "held_out"):
+            raise ValueError(
+                f"Invalid split: {split}. Available splits are: ['dev', 'held_out']"
+            )
+        if self.corpus_raw is None:
+            raise RuntimeError("The corpus must be loaded before iterating tasks.")
+
+        for session_id, session_batch, _, _ in self._sessions_info():
+            if batch is not None and session_batch != batch:
+                continue
+            config = self.get_batch_config(session_batch)
+            if split == "dev" and config.is_heldout_session(session_id):
+                continue
+
+            for task in self._iter_tasks_for_session(
+                session_id, session_batch, registry=Registry()
+            ):
+                if split is None or (split == "held_out") == config.is_heldout(
+                    session_id, task.task_id
+                ):
+                    yield task
+
     def _load_raw_corpus(self):
         # Loads the raw corpus data from the downloaded files into a structured format
         self.corpus_raw = {}
+        zipped = self._zipped_file_ids()
         for file_id, file_name in self.corpus_files.items():
             file_path = self.corpus_local_path / file_name
             if file_name.endswith(".csv"):
                 logging.info(f"Loading CSV file: {file_name}")
                 self.corpus_raw[file_id] = pd.read_csv(file_path)
+            elif file_id in zipped:
+                logging.info(f"Indexing ZIP file: {file_name}")
+                self.zip_archives.add(file_path)
+                self.corpus_raw[file_id] = games_corpus_parsers.index_zip(
+                    file_path, file_id
+                )
             elif file_name.endswith(".zip"):
                 folder_path = self.corpus_local_path / file_id
                 logging.info(f"Loading extracted ZIP folder: {file_id}")
@@ -242,9 +1030,9 @@ class SpanishGamesCorpusDialogues:
                     sub_file_path = folder_path / sub_file
                     self.corpus_raw[file_id][sub_file] = sub_file_path
 
-    def _parse_corpus(self):
-        # Parse the raw corpus files into a structured format
-        self.sessions = {}
+    def _sessions_info(self):
+        # (session_id, batch, subject_a, subject_b) of every session to load
+        sessions_info = []
         for session in self.corpus_raw["sessions-info"].itertuples():
             session_id = session.session_id
             if (
@@ -252,33 +1040,70 @@ class SpanishGamesCorpusDialogues:
             ):  # Changed from self.banned_sessions
                 logging.warning(f"Skipping banned session: {session_id}")
                 continue
-            batch = session.batch
-            subject_a = session.subject_id_A
-            subject_b = session.subject_id_B
-            tasks = self._load_tasks_for_session(
-                session_id,
-                batch,
+            if self.batches is not None and session.batch not in self.batches:
+                continue
+            if self.session_ids is not None and session_id not in self.session_ids:
+                continue
+            sessions_info.append(
+                (session_id, session.batch, session.subject_id_A, session.subject_id_B)
             )
-            session_obj = Session(session_id, batch, subject_a, subject_b, tasks)
-            self.sessions[session_id] = session_obj
+        return sessions_info
+
+    def _parse_corpus(self, workers=None):
+        # Parse the raw corpus files into a structured format
+        self.sessions = {}
+        sessions_info = self._sessions_info()
+
+        if workers and workers > 1:
+            # Sessions are independent, so they are parsed in separate
+            # processes. Registrations made there are lost, so each session is
+            # registered again here, in the same order as the serial path.
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                # Collect every session before touching self, which is pickled
+                # for each submitted session
+                session_objs = list(executor.map(self._load_session, sessions_info))
+            for session_obj in session_objs:
+                session_obj.register(self.registry)
+                self._adopt_columns(session_obj)
+                self._adopt_audio_archives(session_obj)
+                self.sessions[session_obj.session_id] = session_obj
+        else:
+            for session_info in sessions_info:
+                session_obj = self._load_session(session_info)
+                self.sessions[session_obj.session_id] = session_obj
+
+    def _load_session(self, session_info):
+        session_id, batch, subject_a, subject_b = session_info
+        tasks = self._load_tasks_for_session(
+            session_id,
+            batch,
+        )
+        return Session(
+            session_id, batch, subject_a, subject_b, tasks, registry=self.registry
+        )
 
     def _load_tasks_for_session(self, session_id, batch):
-        tasks = []
+        return list(self._iter_tasks_for_session(session_id, batch))
+
+    def _iter_tasks_for_session(self, session_id, batch, registry=None):
+        registry = registry or self.registry
         if batch == 1:
             tasks_folder = self.corpus_raw["b1-dialogue-tasks"]
             wav_folder = self.corpus_raw.get("b1-dialogue-wavs")
-            phrases_folder = self.corpus_raw["b1-dialogue-phrases"]
-            turns_folder = self.corpus_raw["b1-dialogue-turns"]
-            words_folder = self.corpus_raw["b1-dialogue-words"]
+            wav_archive = self.audio_archives.get("b1-dialogue-wavs")
+            phrases_folder = self.corpus_raw.get("b1-dialogue-phrases")
+            turns_folder = self.corpus_raw.get("b1-dialogue-turns")
+            words_folder = self.corpus_raw.get("b1-dialogue-words")
         elif batch == 2:
             tasks_folder = self.corpus_raw["b2-dialogue-tasks"]
             wav_folder = self.corpus_raw.get("b2-dialogue-wavs")
-            phrases_folder = self.corpus_raw["b2-dialogue-phrases"]
-            turns_folder = self.corpus_raw["b2-dialogue-turns"]
+            wav_archive = self.audio_archives.get("b2-dialogue-wavs")
+            phrases_folder = self.corpus_raw.get("b2-dialogue-phrases")
+            turns_folder = self.corpus_raw.get("b2-dialogue-turns")
             words_folder = None
         else:
             logging.error(f"Unknown batch number: {batch}")
-            return tasks
+            return
 
         # Load tasks from the tasks file
         sess_idx = f"s{str(session_id).zfill(2)}"
@@ -290,34 +1115,66 @@ class SpanishGamesCorpusDialogues:
         if not tasks_file:
             raise ValueError(f"Tasks file {task_file_id} not found in {tasks_folder}.")
         tasks_info = games_corpus_parsers.load_tasks_info(tasks_file, batch)
-
-        for info in tasks_info:
-            task_id = info["Task ID"]
-            task_boundaries = (info["Start"], info["End"], task_id, session_id)
-
-            wavs = games_corpus_parsers.load_wavs_for_task(
-                session_id, task_id, wav_folder, batch
-            )
-            ipus = games_corpus_parsers.load_ipus_for_task(
+        # Tiers that are not loaded are left empty, without reading their files
+        if "ipus" in self.tiers:
+            ipus_by_task = games_corpus_parsers.iter_ipus_for_session(
                 session_id,
-                task_id,
-                task_boundaries,
+                tasks_info,
                 phrases_folder,
                 words_folder,
                 batch,
+                registry=registry,
             )
-
-            turns = games_corpus_parsers.load_turns_for_task(
-                session_id, task_id, turns_folder, batch, ipus, task_boundaries
+        else:
+            ipus_by_task = ([] for _ in tasks_info)
+        if "turns" in self.tiers:
+            turns_lines_by_task = games_corpus_parsers.iter_turns_lines_for_session(
+                session_id, tasks_info, turns_folder, batch
             )
+        else:
+            turns_lines_by_task = ({} for _ in tasks_info)
+
+        for info, ipus, turns_lines in zip(
+            tasks_info, ipus_by_task, turns_lines_by_task
+        ):
+            task_id = info["Task ID"]
+            task_boundaries = (info["Start"], info["End"], task_id, session_id)
+
+            if wav_archive:
+                wavs = games_corpus_audio.LazyWavs(
+                    wav_archive,
+                    games_corpus_parsers.wav_file_ids_for_task(
+                        session_id, task_id, batch
+                    ),
+                )
+            else:
+                wavs = games_corpus_parsers.load_wavs_for_task(
+                    session_id, task_id, wav_folder, batch
+                )
 
-            turn_transitions = games_corpus_parsers.load_turn_transitions_for_task(
+            turns = games_corpus_parsers.load_turns_for_task(
                 session_id,
                 task_id,
                 turns_folder,
                 batch,
-                turns,
+                ipus,
                 task_boundaries,
+                turns_lines=turns_lines,
+                registry=registry,
+            )
+
+            turn_transitions = (
+                games_corpus_parsers.load_turn_transitions_for_task(
+                    session_id,
+                    task_id,
+                    turns_folder,
+                    batch,
+                    turns,
+                    task_boundaries,
+                    turns_lines=turns_lines,
+                )
+                if "transitions" in self.tiers
+                else []
             )
 
             task_obj = Task(
@@ -335,7 +1192,8 @@ class SpanishGamesCorpusDialogues:
                 wavs=wavs,
                 turns=turns,
             )
-            tasks.append(task_obj)
-
+            if self.columnar:
+                import games_corpus_columnar
 
-        return tasks
+                games_corpus_columnar.to_columnar(task_obj, self.vocabulary)
+            yield task_obj
@@ -0,0 +1,666 @@
+"""On-demand access to the audio of the Games Corpus."""
+
+import io
+import logging
+import os
+import random
+import shutil
+import struct
+import threading
+import zipfile
+from collections import deque
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import requests
+
+
+class RangeNotSupported(IOError):
+    """The server does not answer HTTP Range requests"""
+
+
+class HttpRangeFile(io.RawIOBase):
+    """Read-only, seekable file over HTTP Range requests.
+
+    Reads are served from one cached block of at least ``block_size`` bytes,
+    so that the many small reads made by ``zipfile`` do not each cost a
+    request.
+    """
+
+    def __init__(
+        self, url: str, session: requests.Session, block_size: int = 1 << 20
+    ):
+        super().__init__()
+        self.url = url
+        self.session = session
+        self.block_size = block_size
+        self._pos = 0
+        self._block_start = 0
+        self._block = b""
+        # The total size comes with the first range
+        response = self._get(0, 0)
+        self.size = int(response.headers["Content-Range"].rsplit("/", 1)[1])
+
+    def _get(self, start: int, end: int) -> requests.Response:
+        response = self.session.get(
+            self.url, headers={"Range": f"bytes={start}-{end}"}, timeout=30
+        )
+        response.raise_for_status()
+        if response.status_code != 206:
+            response.close()
+            raise RangeNotSupported(f"No range support for {self.url}")
+        return response
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            self._pos = offset
+        elif whence == io.SEEK_CUR:
+            self._pos += offset
+        elif whence == io.SEEK_END:
+            self._pos = self.size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        return self._pos
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            size = self.size - self._pos
+        size = min(size, self.size - self._pos)
+        if size <= 0:
+            return b""
+        offset = self._pos - self._block_start
+        if offset < 0 or offset + size > len(self._block):
+            end = min(self.size, self._pos + max(size, self.block_size))
+            self._block = self._get(self._pos, end - 1).content
+            self._block_start = self._pos
+            offset = 0
+        data = self._block[offset : offset + size]
+        self._pos += len(data)
+        return data
+
+    def readinto(self, buffer) -> int:
+        data = self.read(len(buffer))
+        buffer[: len(data)] = data
+        return len(data)
+
+
+class AudioArchive:
+    """A wav archive whose files are extracted one at a time, when needed.
+
+    Files are extracted to the same place as extracting the whole archive
+    would put them. The archive is read locally when it was downloaded, and
+    otherwise through HTTP Range requests, so only its central directory and
+    the requested files are transferred. If the server does not support
+    ranges, the whole archive is downloaded once.
+    """
+
+    def __init__(self, downloader, file_id: str, file_name: str):
+        self.downloader = downloader
+        self.file_id = file_id
+        self.file_name = file_name
+        self._zip = None
+        self._lock = threading.Lock()
+
+    @property
+    def local_archive(self) -> Path:
+        return self.downloader.local_path / self.file_name
+
+    def path(self, name: str) -> Path:
+        """Where the file ``name`` of the archive is extracted"""
+        return self.downloader.local_path / self.file_id / name
+
+    def extract(self, name: str) -> Optional[Path]:
+        """Extract the file ``name`` unless already extracted, or None if missing"""
+        path = self.path(name)
+        # Files are renamed into place once complete
+        if path.exists():
+            return path
+        with self._lock:
+            archive = self._open()
+            try:
+                member = archive.getinfo(f"{self.file_id}/{name}")
+            except KeyError:
+                return None
+            logging.info(f"Extracting {name} from {self.file_name}...")
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_name(path.name + ".tmp")
+            with archive.open(member) as src, open(tmp_path, "wb") as dst:
+                shutil.copyfileobj(src, dst, self.downloader.chunk_size)
+            os.replace(tmp_path, path)
+        return path
+
+    def _open(self) -> zipfile.ZipFile:
+        if self._zip is None:
+            if not self.local_archive.exists():
+                url = self.downloader.url.format(filename=self.file_name)
+                try:
+                    self._zip = zipfile.ZipFile(
+                        HttpRangeFile(url, self.downloader.session)
+                    )
+                    return self._zip
+                except RangeNotSupported as e:
+                    logging.warning(f"{e}; downloading the whole archive")
+                    self.downloader._download_file(self.file_name)
+            self._zip = zipfile.ZipFile(self.local_archive)
+        return self._zip
+
+    def __getstate__(self):
+        # Open archives and locks stay in the process that created them
+        return {**self.__dict__, "_zip": None, "_lock": None}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+
+class LazyWavs(Mapping):
+    """Speaker to wav path mapping whose files are extracted on first access.
+
+    Reading any entry extracts the task's wavs from their ``AudioArchive``.
+    Files missing from the archive are left out, with a warning.
+
+    The archive belongs to the corpus and is not pickled along; only its
+    file ID is, and ``attach`` sets the archive again after unpickling.
+    """
+
+    def __init__(self, archive: AudioArchive, names: Dict[str, str]):
+        self.archive = archive
+        self.file_id = archive.file_id
+        self.names = names
+        self._wavs = None
+
+    def attach(self, archives: Dict[str, AudioArchive]):
+        """Use the archive of ``archives`` with this mapping's file ID"""
+        self.archive = archives[self.file_id]
+
+    def __getstate__(self):
+        return {**self.__dict__, "archive": None}
+
+    def _materialize(self) -> Dict[str, Path]:
+        if self._wavs is None:
+            if self.archive is None:
+                raise RuntimeError(
+                    f"No {self.file_id} archive attached to extract the wavs from"
+                )
+            wavs = {}
+            for speaker, name in self.names.items():
+                path = self.archive.extract(name)
+                if path is None:
+                    logging.warning(f"WAV file {name} not found.")
+                    continue
+                wavs[speaker] = path
+            self._wavs = wavs
+        return self._wavs
+
+    @property
+    def materialized(self) -> bool:
+        return self._wavs is not None
+
+    def __getitem__(self, speaker):
+        return self._materialize()[speaker]
+
+    def __iter__(self):
+        return iter(self._materialize())
+
+    def __len__(self):
+        return len(self._materialize())
+
+    def __repr__(self) -> str:
+        if self._wavs is None:
+            return f"LazyWavs({self.names})"
+        return repr(self._wavs)
+
+
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+@dataclass(frozen=True)
+class WavFile:
+    """A PCM or float wav file whose samples are memory-mapped.
+
+    ``samples`` has one row per frame, and one column per channel when the
+    file has more than one.
+    """
+
+    path: Path
+    samplerate: int
+    samples: "np.ndarray"
+
+    # (format, bits per sample) to sample dtype
+    DTYPES = {
+        (1, 8): "u1",
+        (1, 16): "<i2",
+        (1, 32): "<i4",
+        (3, 32): "<f4",
+        (3, 64): "<f8",
+    }
+
+    @classmethod
+    def open(cls, path) -> "WavFile":
+        import numpy as np
+
+        path = Path(path)
+        with open(path, "rb") as f:
+            riff, _, wave_id = struct.unpack("<4sI4s", f.read(12))
+            if riff != b"RIFF" or wave_id != b"WAVE":
+                raise ValueError(f"{path} is not a wav file")
+            fmt = None
+            while True:
+                header = f.read(8)
+                if len(header) < 8:
+                    raise ValueError(f"{path} has no data chunk")
+                chunk_id, chunk_size = struct.unpack("<4sI", header)
+                if chunk_id == b"fmt ":
+                    fmt = f.read(chunk_size)
+                elif chunk_id == b"data":
+                    offset = f.tell()
+                    break
+                else:
+                    f.seek(chunk_size, io.SEEK_CUR)
+                # Chunks are padded to an even size
+                f.seek(chunk_size % 2, io.SEEK_CUR)
+        if fmt is None:
+            raise ValueError(f"{path} has no fmt chunk")
+
+        audio_format, channels, samplerate = struct.unpack("<HHI", fmt[:8])
+        bits = struct.unpack("<H", fmt[14:16])[0]
+        if audio_format == WAVE_FORMAT_EXTENSIBLE:
+            audio_format = struct.unpack("<H", fmt[24:26])[0]
+        dtype = cls.DTYPES.get((audio_format, bits))
+        if dtype is None:
+            raise ValueError(
+                f"Cannot memory-map {path}: format {audio_format} with {bits} bits"
+            )
+
+        frame_size = channels * bits // 8
+        # The data chunk size may overstate what was actually written
+        frames = min(chunk_size, path.stat().st_size - offset) // frame_size
+        shape = (frames, channels) if channels > 1 else (frames,)
+        samples = np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=shape)
+        return cls(path, samplerate, samples)
+
+    def segment(self, start: float, end: float) -> "np.ndarray":
+        """Frames between ``start`` and ``end`` seconds, as a view of the file"""
+        first = max(0, round(start * self.samplerate))
+        last = min(len(self.samples), round(end * self.samplerate))
+        return self.samples[first:max(first, last)]
+
+
+def open_wav(path) -> WavFile:
+    """``WavFile`` for ``path``, kept open for later calls until the file changes"""
+    stat = os.stat(path)
+    return _open_wav(Path(path), stat.st_size, stat.st_mtime_ns)
+
+
+@lru_cache(maxsize=128)
+def _open_wav(path: Path, size: int, mtime_ns: int) -> WavFile:
+    return WavFile.open(path)
+
+
+def to_float32(samples: "np.ndarray") -> "np.ndarray":
+    """Samples scaled to float32 in [-1, 1]"""
+    import numpy as np
+
+    if samples.dtype.kind == "f":
+        return samples.astype(np.float32)
+    if samples.dtype.kind == "u":
+        return (samples.astype(np.float32) - 128) / 128
+    return samples.astype(np.float32) / float(2 ** (8 * samples.dtype.itemsize - 1))
+
+
+def write_wav(path, samples: "np.ndarray", samplerate: int):
+    """Write ``samples``, shaped as ``WavFile.samples``, as a wav file.
+
+    int16 samples are written as PCM and float32 ones as IEEE float, so that
+    the file can be memory-mapped back by ``WavFile``.
+    """
+    formats = {"<i2": 1, "<f4": 3}
+    dtype = samples.dtype.newbyteorder("<").str
+    if dtype not in formats:
+        raise ValueError(f"Cannot write {samples.dtype} samples as a wav file")
+    channels = samples.shape[1] if samples.ndim > 1 else 1
+    bits = samples.dtype.itemsize * 8
+    block_align = channels * samples.dtype.itemsize
+    data = samples.astype(dtype, copy=False).tobytes()
+    with open(path, "wb") as f:
+        f.write(struct.pack("<4sI4s", b"RIFF", 36 + len(data), b"WAVE"))
+        f.write(
+            struct.pack(
+                "<4sIHHIIHH",
+                b"fmt ",
+                16,
+                formats[dtype],
+                channels,
+                samplerate,
+                samplerate * block_align,
+                block_align,
+                bits,
+            )
+        )
+        f.write(struct.pack("<4sI", b"data", len(data)))
+        f.write(data)
+
+
+# In order of preference when copies of several sample types exist
+RESAMPLED_DTYPES = ("float32", "int16")
+
+
+def resampled_path(path, sr: int, dtype: str = "int16") -> Path:
+    """Where the copy of the wav ``path`` resampled to ``sr`` is stored.
+
+    Copies go in a "resampled" folder next to the folder of ``path``, which
+    for the corpus wavs is the local corpus folder, in one folder per rate
+    and sample type.
+    """
+    path = Path(path)
+    return (
+        path.parent.parent / "resampled" / f"{sr}hz-{dtype}" / path.parent.name
+    ) / path.name
+
+
+def find_resampled(path, sr: int) -> Optional[Path]:
+    """Existing copy of the wav ``path`` at ``sr``, preferring float32 ones"""
+    for dtype in RESAMPLED_DTYPES:
+        copy_path = resampled_path(path, sr, dtype)
+        if copy_path.exists():
+            return copy_path
+    return None
+
+
+def resample_wav(path, sr: int, dtype: str = "int16") -> Path:
+    """Copy of the wav ``path`` resampled to ``sr``, created unless it exists.
+
+    Returns ``path`` itself when it already has that rate.
+    """
+    if dtype not in RESAMPLED_DTYPES:
+        raise ValueError(
+            f"Invalid dtype: {dtype}. Available dtypes are: {list(RESAMPLED_DTYPES)}"
+        )
+    path = Path(path)
+    wav = open_wav(path)
+    if wav.samplerate == sr:
+        return path
+    copy_path = resampled_path(path, sr, dtype)
+    # Copies are renamed into place once complete
+    if not copy_path.exists():
+        import librosa
+        import numpy as np
+
+        logging.info(f"Resampling {path.name} to {sr} Hz...")
+        samples = librosa.resample(
+            to_float32(wav.samples), orig_sr=wav.samplerate, target_sr=sr, axis=0
+        )
+        if dtype == "int16":
+            samples = np.clip(np.round(samples * 32768), -32768, 32767)
+        copy_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = copy_path.with_name(f"{copy_path.name}.{os.getpid()}.tmp")
+        write_wav(tmp_path, samples.astype(dtype), sr)
+        os.replace(tmp_path, copy_path)
+    return copy_path
+
+
+def _wav_for_rate(path, sr: Optional[int]) -> WavFile:
+    # The wav itself, or its copy at sr when it has another rate
+    wav = open_wav(path)
+    if sr is not None and sr != wav.samplerate:
+        copy_path = find_resampled(path, sr)
+        if copy_path is not None:
+            wav = open_wav(copy_path)
+    return wav
+
+
+def read_segment(path, start: float, end: float, sr: Optional[int] = None):
+    """Audio of ``path`` between ``start`` and ``end`` seconds.
+
+    Without ``sr``, the samples are returned as stored, as a zero-copy view
+    of the memory-mapped file. With ``sr``, they are returned as float32 in
+    [-1, 1] at that sample rate, read from the copy made by ``resample_wav``
+    if there is one, and otherwise resampled with librosa when the rate
+    differs from the file's.
+    """
+    wav = _wav_for_rate(path, sr)
+    samples = wav.segment(start, end)
+    if sr is None:
+        return samples
+    samples = to_float32(samples)
+    if sr != wav.samplerate:
+        import librosa
+
+        samples = librosa.resample(
+            samples, orig_sr=wav.samplerate, target_sr=sr, axis=0
+        )
+    return samples
+
+
+@dataclass
+class AudioBatch:
+    """Audio of a batch of IPUs or turns, zero-padded to the longest one.
+
+    ``audio`` is a C-contiguous float32 array with one row per unit, and
+    ``mask`` is True for the samples of each row that are not padding.
+    """
+
+    units: list
+    audio: "np.ndarray"
+    lengths: "np.ndarray"
+    mask: "np.ndarray"
+
+
+def plan_batches(
+    units: Sequence,
+    batch_size: int,
+    bucket_width: float = 0.5,
+    shuffle: bool = False,
+    seed: Optional[int] = None,
+) -> List[list]:
+    """Split ``units`` into batches of units of similar duration.
+
+    Units are sorted by duration, in buckets ``bucket_width`` seconds wide,
+    and cut into batches of ``batch_size``, so that each batch needs little
+    padding. With ``shuffle``, units are shuffled within their bucket and
+    batches are yielded in random order.
+    """
+    if batch_size < 1:
+        raise ValueError(f"Invalid batch size: {batch_size}")
+    rng = random.Random(seed)
+    order = list(units)
+    if shuffle:
+        rng.shuffle(order)
+    # Sorting is stable, so shuffled units stay shuffled within a bucket
+    order.sort(key=lambda unit: int((unit.end - unit.start) // bucket_width))
+    batches = [order[i : i + batch_size] for i in range(0, len(order), batch_size)]
+    if shuffle:
+        rng.shuffle(batches)
+    return batches
+
+
+def load_batch(units: list, sr: int) -> AudioBatch:
+    """``AudioBatch`` of ``units``, read from their speaker's channel at ``sr``"""
+    import numpy as np
+
+    segments = [unit.audio(sr=sr) for unit in units]
+    lengths = np.array([len(segment) for segment in segments], dtype=np.int64)
+    audio = np.zeros((len(units), lengths.max(initial=0)), dtype=np.float32)
+    for row, segment in zip(audio, segments):
+        row[: len(segment)] = segment
+    mask = np.arange(audio.shape[1]) < lengths[:, None]
+    return AudioBatch(units, audio, lengths, mask)
+
+
+def audio_batches(
+    units: Sequence,
+    sr: int,
+    batch_size: int = 32,
+    bucket_width: float = 0.5,
+    shuffle: bool = False,
+    seed: Optional[int] = None,
+    prefetch: int = 2,
+) -> Iterator[AudioBatch]:
+    """Yield ``AudioBatch``es of ``units`` grouped by duration.
+
+    Batches are planned by ``plan_batches``, and the next ``prefetch`` ones
+    are read on background threads while the current one is used.
+
+    Args:
+        units: IPUs or turns, which must belong to tasks with wav files
+        sr: Sample rate of the batches
+        batch_size: Number of units per batch; the last one may be smaller
+        bucket_width: Width in seconds of the duration buckets
+        shuffle: Shuffle units within buckets, and the order of batches
+        seed: Seed of the shuffling
+        prefetch: Number of batches read ahead. Batches are read when
+            requested if 0.
+    """
+    batches = plan_batches(units, batch_size, bucket_width, shuffle, seed)
+    if prefetch < 1:
+        for batch in batches:
+            yield load_batch(batch, sr)
+        return
+
+    executor = ThreadPoolExecutor(max_workers=prefetch)
+    pending = deque()
+    try:
+        for batch in batches:
+            pending.append(executor.submit(load_batch, batch, sr))
+            if len(pending) > prefetch:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        # Batches read ahead are dropped when iteration stops early
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+@dataclass
+class TransitionWindows:
+    """Audio of both channels around turn transitions.
+
+    ``audio`` is a float32 array of shape (transitions, channels, samples).
+    Each window is the ``before`` seconds up to the end of the transition's
+    ``ipu_from``, followed by the ``after`` seconds from the start of its
+    ``ipu_to``, so that every window has the same length and ``boundary`` is
+    the index of its first sample after the switch. Samples outside the wav
+    files are zeros.
+    """
+
+    transitions: list
+    channels: Tuple[str, ...]
+    sr: int
+    audio: "np.ndarray"
+    boundary: int
+
+    @property
+    def label_types(self) -> list:
+        return [transition.label_type for transition in self.transitions]
+
+    @property
+    def labels(self) -> "np.ndarray":
+        """Label of each transition, as in ``TurnTransitionType`` values"""
+        import numpy as np
+
+        return np.array([label.value for label in self.label_types])
+
+
+def transition_windows(
+    tasks: Sequence,
+    before: float = 2.0,
+    after: float = 1.0,
+    sr: Optional[int] = None,
+    channels: Sequence[str] = ("A", "B"),
+) -> TransitionWindows:
+    """``TransitionWindows`` of the turn transitions of ``tasks``, in order.
+
+    Only transitions with an ``ipu_from`` get a window: those without a
+    previous turn, such as X1 and X3 ones, have no switch to anchor a window
+    to and are left out, so the result may have fewer rows than there are
+    transitions. Columnar tasks are supported. The windows of each task are
+    gathered from a sliding-window view of each memory-mapped wav, with one
+    indexing per channel and half. With ``sr``, the wavs are read from their
+    copies made by ``resample_wav``; otherwise all wavs must share their
+    rate.
+    """
+    import numpy as np
+
+    transitions_by_task = [
+        (task, [t for t in task.turn_transitions if t.ipu_from is not None])
+        for task in tasks
+    ]
+    transitions_by_task = [(task, ts) for task, ts in transitions_by_task if ts]
+
+    wavs = {
+        (id(task), channel): _wav_at(task.wavs[channel], sr)
+        for task, _ in transitions_by_task
+        for channel in channels
+    }
+    rates = {wav.samplerate for wav in wavs.values()}
+    if len(rates) > 1:
+        raise ValueError(f"The wav files have different sample rates: {rates}")
+    rate = sr or next(iter(rates), 0)
+
+    transitions = [t for _, ts in transitions_by_task for t in ts]
+    n_before, n_after = round(before * rate), round(after * rate)
+    audio = np.zeros(
+        (len(transitions), len(channels), n_before + n_after), dtype=np.float32
+    )
+    first_row = 0
+    for task, task_transitions in transitions_by_task:
+        rows = slice(first_row, first_row + len(task_transitions))
+        first_row = rows.stop
+        ends = [t.ipu_from.end for t in task_transitions]
+        starts = [t.ipu_to.start for t in task_transitions]
+        firsts_before = np.round(np.multiply(ends, rate)).astype(np.int64) - n_before
+        firsts_after = np.round(np.multiply(starts, rate)).astype(np.int64)
+        for column, channel in enumerate(channels):
+            samples = wavs[id(task), channel].samples
+            audio[rows, column, :n_before] = _gather(samples, firsts_before, n_before)
+            audio[rows, column, n_before:] = _gather(samples, firsts_after, n_after)
+    return TransitionWindows(transitions, tuple(channels), rate, audio, n_before)
+
+
+def _gather(samples: "np.ndarray", firsts: "np.ndarray", length: int):
+    # float32 windows of length samples from each of firsts, with zeros for
+    # the samples outside the file
+    import numpy as np
+    from numpy.lib.stride_tricks import sliding_window_view
+
+    windows = np.zeros((len(firsts), length), dtype=np.float32)
+    if length == 0:
+        return windows
+    inside = (firsts >= 0) & (firsts + length <= len(samples))
+    if inside.any():
+        view = sliding_window_view(samples, length)
+        windows[inside] = to_float32(view[firsts[inside]])
+    # Windows that cross the start or end of the file are sliced one by one
+    for row in np.flatnonzero(~inside):
+        first = max(firsts[row], 0)
+        last = min(firsts[row] + length, len(samples))
+        if first < last:
+            offset = first - firsts[row]
+            windows[row, offset : offset + last - first] = to_float32(
+                samples[first:last]
+            )
+    return windows
+
+
+def _wav_at(path, sr: Optional[int]) -> WavFile:
+    wav = _wav_for_rate(path, sr)
+    if sr is not None and wav.samplerate != sr:
+        raise ValueError(
+            f"{path} is at {wav.samplerate} Hz; resample it to {sr} Hz first"
+        )
+    if wav.samples.ndim > 1:
+        raise ValueError(f"{path} is not a single-channel wav file")
+    return wav
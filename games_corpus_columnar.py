@@ -0,0 +1,490 @@
+"""Columnar (struct-of-arrays) storage for the words, IPUs and turns of a task.
+
+Requires NumPy. A task converted with ``to_columnar`` keeps its words, IPUs,
+turns and turn transitions in NumPy arrays held by ``task.columns``, and its
+``ipus``, ``turns`` and ``turn_transitions`` become lightweight views over
+those arrays, with the same attributes as ``IPU``, ``Turn`` and
+``TurnTransition``. Views are not registered, so the ``get_*_by_id`` lookups
+do not find them.
+"""
+
+from collections.abc import Sequence
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from games_corpus_types import IPU, Turn, TurnTransitionType, Word
+
+
+class Vocabulary:
+    """Maps word texts to integer IDs, shared by the tasks of a corpus"""
+
+    def __init__(self):
+        self.words: List[str] = []
+        self._ids: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    def id(self, word: str) -> int:
+        word_id = self._ids.get(word)
+        if word_id is None:
+            word_id = self._ids[word] = len(self.words)
+            self.words.append(word)
+        return word_id
+
+    def ids(self, words) -> np.ndarray:
+        return np.array([self.id(word) for word in words], dtype=np.int32)
+
+    def __getstate__(self):
+        return self.words
+
+    def __setstate__(self, words):
+        self.words = words
+        self._ids = {word: i for i, word in enumerate(words)}
+
+
+def _offsets(counts) -> np.ndarray:
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(np.asarray(counts, dtype=np.int64), out=offsets[1:])
+    return offsets
+
+
+@dataclass
+class TaskColumns:
+    """Struct-of-arrays storage of a task.
+
+    The words of IPU ``i`` are ``ipu_word_offsets[i]:ipu_word_offsets[i + 1]``
+    of the word arrays, and the IPUs of turn ``j`` are
+    ``turn_ipus[turn_ipu_offsets[j]:turn_ipu_offsets[j + 1]]``. Speakers are
+    stored as indices into ``speakers``, word texts as IDs in ``vocabulary``
+    and transition turns as indices into the turn arrays, with -1 for a
+    missing previous turn.
+    """
+
+    session_id: int
+    task_id: int
+    speakers: Tuple[str, ...]
+    vocabulary: Vocabulary
+
+    word_start: np.ndarray
+    word_end: np.ndarray
+    word_text: np.ndarray
+
+    ipu_speaker: np.ndarray
+    ipu_word_offsets: np.ndarray
+
+    turn_speaker: np.ndarray
+    turn_start: np.ndarray
+    turn_end: np.ndarray
+    turn_ipu_offsets: np.ndarray
+    turn_ipus: np.ndarray
+
+    transition_label: np.ndarray
+    transition_from: np.ndarray
+    transition_to: np.ndarray
+    transition_duration: np.ndarray
+
+    @property
+    def ipu_start(self) -> np.ndarray:
+        return self.word_start[self.ipu_word_offsets[:-1]]
+
+    @property
+    def ipu_end(self) -> np.ndarray:
+        return self.word_end[self.ipu_word_offsets[1:] - 1]
+
+    @property
+    def turn_duration(self) -> np.ndarray:
+        return self.turn_end - self.turn_start
+
+    @property
+    def overlapped_transition(self) -> np.ndarray:
+        return self.transition_duration < 0
+
+    def use_vocabulary(self, vocabulary: Vocabulary):
+        """Re-encode the word texts with the IDs of another vocabulary"""
+        if vocabulary is self.vocabulary:
+            return
+        new_ids = vocabulary.ids(self.vocabulary.words)
+        self.word_text = new_ids[self.word_text] if len(new_ids) else self.word_text
+        self.vocabulary = vocabulary
+
+    @classmethod
+    def from_task(cls, task, vocabulary: Optional[Vocabulary] = None):
+        """Build the columns of a task from its IPU, turn and transition objects"""
+        vocabulary = vocabulary if vocabulary is not None else Vocabulary()
+        speakers = tuple(
+            sorted({ipu.speaker for ipu in task.ipus} | {t.speaker for t in task.turns})
+        )
+        speaker_index = {speaker: i for i, speaker in enumerate(speakers)}
+        words = [word for ipu in task.ipus for word in ipu.words]
+        ipu_index = {id(ipu): i for i, ipu in enumerate(task.ipus)}
+        turn_index = {id(turn): i for i, turn in enumerate(task.turns)}
+        transitions = task.turn_transitions
+
+        return cls(
+            session_id=task.session_id,
+            task_id=task.task_id,
+            speakers=speakers,
+            vocabulary=vocabulary,
+            word_start=np.array([word.start for word in words], dtype=np.float64),
+            word_end=np.array([word.end for word in words], dtype=np.float64),
+            word_text=vocabulary.ids(word.text for word in words),
+            ipu_speaker=np.array(
+                [speaker_index[ipu.speaker] for ipu in task.ipus], dtype=np.int8
+            ),
+            ipu_word_offsets=_offsets([ipu.num_words for ipu in task.ipus]),
+            turn_speaker=np.array(
+                [speaker_index[turn.speaker] for turn in task.turns], dtype=np.int8
+            ),
+            turn_start=np.array([t.start for t in task.turns], dtype=np.float64),
+            turn_end=np.array([t.end for t in task.turns], dtype=np.float64),
+            turn_ipu_offsets=_offsets([len(turn.ipus) for turn in task.turns]),
+            turn_ipus=np.array(
+                [ipu_index[id(ipu)] for turn in task.turns for ipu in turn.ipus],
+                dtype=np.int32,
+            ),
+            transition_label=np.array([t.label for t in transitions], dtype=str),
+            transition_from=np.array(
+                [turn_index.get(id(t.turn_from), -1) for t in transitions],
+                dtype=np.int32,
+            ),
+            transition_to=np.array(
+                [turn_index[id(t.turn_to)] for t in transitions], dtype=np.int32
+            ),
+            transition_duration=np.array(
+                [t.transition_duration for t in transitions], dtype=np.float64
+            ),
+        )
+
+
+class _View:
+    """Base of the views over a ``TaskColumns`` row"""
+
+    __slots__ = ("columns", "index")
+
+    def __init__(self, columns: TaskColumns, index: int):
+        self.columns = columns
+        self.index = index
+
+    def __eq__(self, other):
+        return (
+            type(other) is type(self)
+            and other.columns is self.columns
+            and other.index == self.index
+        )
+
+    def __hash__(self):
+        return hash((id(self.columns), self.index))
+
+    def register(self, registry=None):
+        """Views are not registered"""
+
+    def unregister(self):
+        """Views are not registered"""
+
+
+class IPUView(_View):
+    """An IPU stored in a ``TaskColumns``"""
+
+    __slots__ = ()
+
+    @property
+    def _words_range(self) -> Tuple[int, int]:
+        offsets = self.columns.ipu_word_offsets
+        return int(offsets[self.index]), int(offsets[self.index + 1])
+
+    @property
+    def speaker(self) -> str:
+        return self.columns.speakers[self.columns.ipu_speaker[self.index]]
+
+    @property
+    def start(self) -> float:
+        return float(self.columns.word_start[self._words_range[0]])
+
+    @property
+    def end(self) -> float:
+        return float(self.columns.word_end[self._words_range[1] - 1])
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+    @property
+    def num_words(self) -> int:
+        lo, hi = self._words_range
+        return hi - lo
+
+    @property
+    def words(self) -> List[Word]:
+        lo, hi = self._words_range
+        columns = self.columns
+        speaker = self.speaker
+        return [
+            Word(
+                start=float(columns.word_start[i]),
+                end=float(columns.word_end[i]),
+                text=columns.vocabulary.words[columns.word_text[i]],
+                speaker=speaker,
+            )
+            for i in range(lo, hi)
+        ]
+
+    @property
+    def text(self) -> str:
+        lo, hi = self._words_range
+        words = self.columns.vocabulary.words
+        return " ".join(words[i] for i in self.columns.word_text[lo:hi])
+
+    @property
+    def ipu_id(self) -> str:
+        return IPU.id_builder(self.speaker, self.start, self.end)
+
+    def __str__(self) -> str:
+        return f"[IPU ({self.speaker}) {self.start:.02f}:{self.end:.02f} ] {self.text}"
+
+    def __repr__(self) -> str:
+        return f"IPUView({self.ipu_id})"
+
+
+class TurnView(_View):
+    """A turn stored in a ``TaskColumns``"""
+
+    __slots__ = ()
+
+    @property
+    def session_id(self) -> int:
+        return self.columns.session_id
+
+    @property
+    def task_id(self) -> int:
+        return self.columns.task_id
+
+    @property
+    def speaker(self) -> str:
+        return self.columns.speakers[self.columns.turn_speaker[self.index]]
+
+    @property
+    def start(self) -> float:
+        return float(self.columns.turn_start[self.index])
+
+    @property
+    def end(self) -> float:
+        return float(self.columns.turn_end[self.index])
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+    @property
+    def ipus(self) -> List[IPUView]:
+        offsets = self.columns.turn_ipu_offsets
+        lo, hi = offsets[self.index], offsets[self.index + 1]
+        return [IPUView(self.columns, int(i)) for i in self.columns.turn_ipus[lo:hi]]
+
+    @property
+    def ipu_ids(self) -> List[str]:
+        return [ipu.ipu_id for ipu in self.ipus]
+
+    @property
+    def num_words(self) -> int:
+        return sum(ipu.num_words for ipu in self.ipus)
+
+    @property
+    def text(self) -> str:
+        return f"[Turn ({self.speaker}) {self.start:.02f}:{self.end:.02f} ] \t " + (
+            " ".join(ipu.text for ipu in self.ipus)
+        )
+
+    @property
+    def turn_id(self) -> str:
+        return Turn.id_builder(
+            self.session_id, self.task_id, self.speaker, self.start, self.end
+        )
+
+    def __str__(self) -> str:
+        return self.text
+
+    def __repr__(self) -> str:
+        return f"TurnView({self.turn_id})"
+
+
+class TurnTransitionView(_View):
+    """A turn transition stored in a ``TaskColumns``"""
+
+    __slots__ = ()
+
+    @property
+    def label(self) -> str:
+        return str(self.columns.transition_label[self.index])
+
+    @property
+    def label_type(self) -> TurnTransitionType:
+        return TurnTransitionType.from_string(self.label)
+
+    @property
+    def turn_from(self) -> Optional[TurnView]:
+        turn = self.columns.transition_from[self.index]
+        return TurnView(self.columns, int(turn)) if turn >= 0 else None
+
+    @property
+    def turn_to(self) -> TurnView:
+        return TurnView(self.columns, int(self.columns.transition_to[self.index]))
+
+    @property
+    def turn_id_from(self) -> Optional[str]:
+        turn_from = self.turn_from
+        return turn_from.turn_id if turn_from else None
+
+    @property
+    def turn_id_to(self) -> str:
+        return self.turn_to.turn_id
+
+    @property
+    def ipu_from(self) -> Optional[IPUView]:
+        turn_from = self.turn_from
+        return turn_from.ipus[-1] if turn_from else None
+
+    @property
+    def ipu_to(self) -> IPUView:
+        return self.turn_to.ipus[0]
+
+    @property
+    def speaker_from(self) -> Optional[str]:
+        turn_from = self.turn_from
+        return turn_from.speaker if turn_from else None
+
+    @property
+    def speaker_to(self) -> str:
+        return self.turn_to.speaker
+
+    @property
+    def session_id(self) -> int:
+        return self.columns.session_id
+
+    @property
+    def task_id(self) -> int:
+        return self.columns.task_id
+
+    @property
+    def transition_duration(self) -> float:
+        return float(self.columns.transition_duration[self.index])
+
+    @property
+    def overlapped_transition(self) -> bool:
+        return self.transition_duration < 0
+
+    def __repr__(self) -> str:
+        return (
+            f"TurnTransitionView({self.label}, {self.turn_id_from}, {self.turn_id_to})"
+        )
+
+
+class ColumnarSequence(Sequence):
+    """Read-only sequence of views over the rows of a ``TaskColumns``"""
+
+    def __init__(self, columns: TaskColumns, view_cls, length: int):
+        self.columns = columns
+        self.view_cls = view_cls
+        self.length = length
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self.length))]
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError(f"{self.view_cls.__name__} index out of range")
+        return self.view_cls(self.columns, index)
+
+
+def to_columnar(task, vocabulary: Optional[Vocabulary] = None):
+    """Move a task's IPUs, turns and transitions into columns, in place.
+
+    The IPU and turn objects are removed from their registry so that they
+    can be freed. Returns the task.
+    """
+    columns = TaskColumns.from_task(task, vocabulary)
+    for turn in task.turns:
+        turn.unregister()
+    for ipu in task.ipus:
+        ipu.unregister()
+
+    task.columns = columns
+    task.ipus = ColumnarSequence(columns, IPUView, len(columns.ipu_word_offsets) - 1)
+    task.turns = ColumnarSequence(columns, TurnView, len(columns.turn_start))
+    task.turn_transitions = ColumnarSequence(
+        columns, TurnTransitionView, len(columns.transition_label)
+    )
+    task._turns_index = None
+    return task
+
+
+def transition_durations_by_label(tasks) -> Dict[str, np.ndarray]:
+    """Turn transition durations of columnar tasks, grouped by label"""
+    columns = [task.columns for task in tasks]
+    if not columns:
+        return {}
+    labels = np.concatenate([c.transition_label for c in columns])
+    durations = np.concatenate([c.transition_duration for c in columns])
+    return {str(label): durations[labels == label] for label in np.unique(labels)}
+
+
+def _ipu_intervals(task, speakers) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # (speaker row, start, end) of the IPUs of a task, from its columns if any
+    if task.columns is not None:
+        columns = task.columns
+        rows = np.array(
+            [speakers.index(s) if s in speakers else -1 for s in columns.speakers],
+            dtype=np.int64,
+        )
+        return rows[columns.ipu_speaker], columns.ipu_start, columns.ipu_end
+    ipus = task.ipus
+    rows = np.array(
+        [speakers.index(i.speaker) if i.speaker in speakers else -1 for i in ipus],
+        dtype=np.int64,
+    )
+    starts = np.fromiter((ipu.start for ipu in ipus), np.float64, len(ipus))
+    ends = np.fromiter((ipu.end for ipu in ipus), np.float64, len(ipus))
+    return rows, starts, ends
+
+
+def vad_matrices(
+    tasks, frame_hz: float = 50, speakers: Tuple[str, ...] = ("A", "B")
+) -> List[np.ndarray]:
+    """Voice activity of each speaker of each task, frame by frame.
+
+    Each matrix is boolean, with one row per speaker and one column per
+    ``1 / frame_hz`` seconds frame from the task start, and is True where
+    the speaker has an IPU, with IPU boundaries rounded to the nearest frame.
+    The matrices missing from ``task.vad_cache`` are rasterized together,
+    with a single cumulative sum over all tasks, and cached. Cached
+    matrices are read-only; copy one to modify it.
+    """
+    speakers = tuple(speakers)
+    missing = [t for t in tasks if (frame_hz, speakers) not in t.vad_cache]
+    n_frames = [int(np.ceil(task.duration * frame_hz)) for task in missing]
+    offsets = _offsets(n_frames)
+    # +1 at the first frame of each IPU and -1 past its last one, so that
+    # the cumulative sum counts the IPUs active in each frame
+    changes = np.zeros((len(speakers), offsets[-1] + 1), dtype=np.int32)
+    for task, offset, length in zip(missing, offsets, n_frames):
+        rows, starts, ends = _ipu_intervals(task, speakers)
+        first = np.clip(np.round((starts - task.start) * frame_hz), 0, length)
+        last = np.clip(np.round((ends - task.start) * frame_hz), 0, length)
+        keep = (rows >= 0) & (last > first)
+        rows = rows[keep]
+        np.add.at(changes, (rows, offset + first[keep].astype(np.int64)), 1)
+        np.add.at(changes, (rows, offset + last[keep].astype(np.int64)), -1)
+    active = np.cumsum(changes, axis=1) > 0
+    for task, start, end in zip(missing, offsets[:-1], offsets[1:]):
+        # Copied, so that a matrix does not keep the others alive, and
+        # read-only, since the same matrix is returned on every call
+        vad = active[:, start:end].copy()
+        vad.flags.writeable = False
+        task.vad_cache[frame_hz, speakers] = vad
+    return [task.vad_cache[frame_hz, speakers] for task in tasks]
@@ -0,0 +1,207 @@
+"""Disk-backed cache of audio features for the units of the Games Corpus.
+
+Features are computed by named extractors, registered with
+``register_extractor``, and stored by ``FeatureStore``: one ``.npz`` chunk per
+task and kind of unit, under a folder per extractor and parameters. NumPy is
+required, and librosa for the built-in extractors.
+"""
+
+import hashlib
+import json
+import logging
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+import games_corpus_audio
+
+EXTRACTORS: Dict[str, Callable] = {}
+
+UNITS = ("ipu", "turn")
+
+TMP_SUFFIX = ".tmp.npz"
+
+
+def register_extractor(name: str):
+    """Register ``function(samples, sr, **params)`` as the extractor ``name``"""
+
+    def decorator(function: Callable) -> Callable:
+        EXTRACTORS[name] = function
+        return function
+
+    return decorator
+
+
+@register_extractor("mfcc")
+def _mfcc(samples, sr, **params):
+    import librosa
+
+    return librosa.feature.mfcc(y=samples, sr=sr, **params)
+
+
+@register_extractor("melspectrogram")
+def _melspectrogram(samples, sr, **params):
+    import librosa
+
+    return librosa.feature.melspectrogram(y=samples, sr=sr, **params)
+
+
+@register_extractor("spectral_centroid")
+def _spectral_centroid(samples, sr, **params):
+    import librosa
+
+    return librosa.feature.spectral_centroid(y=samples, sr=sr, **params)
+
+
+@dataclass(frozen=True)
+class FeatureExtractor:
+    """A registered extractor with its parameters.
+
+    ``sr`` is the sample rate the audio is read at; the rate of each wav file
+    when None. Extractors receive float32 samples in [-1, 1].
+    """
+
+    name: str
+    params: Tuple[tuple, ...] = ()
+    sr: Optional[int] = None
+
+    @classmethod
+    def create(cls, name: str, sr: Optional[int] = None, **params):
+        if name not in EXTRACTORS:
+            raise ValueError(
+                f"Unknown extractor: {name}. Registered extractors are: "
+                f"{list(EXTRACTORS)}"
+            )
+        return cls(name, tuple(sorted(params.items())), sr)
+
+    @property
+    def key(self) -> str:
+        """Folder name identifying the extractor and its parameters"""
+        description = json.dumps([self.name, self.sr, self.params], default=repr)
+        digest = hashlib.sha1(description.encode("utf-8")).hexdigest()[:16]
+        return f"{self.name}-{digest}"
+
+    def __call__(self, unit) -> np.ndarray:
+        """Features of the audio of ``unit``, from its speaker's channel"""
+        sr = self.sr
+        if sr is None:
+            wav = games_corpus_audio.open_wav(unit.task.wavs[unit.speaker])
+            sr = wav.samplerate
+        features = EXTRACTORS[self.name](unit.audio(sr=sr), sr, **dict(self.params))
+        return np.asarray(features)
+
+
+def task_units(task, units: str) -> list:
+    if units == "ipu":
+        return task.ipus
+    if units == "turn":
+        return task.turns
+    raise ValueError(f"Invalid units: {units}. Available units are: {list(UNITS)}")
+
+
+def unit_id(unit) -> str:
+    return unit.ipu_id if hasattr(unit, "ipu_id") else unit.turn_id
+
+
+class FeatureStore:
+    """Features of IPUs and turns stored on disk, keyed by unit and extractor.
+
+    Each chunk holds the features of the units of one kind in one task, so
+    that a task's features are read and written together. Reading a chunk
+    marks it as recently used; once the chunks take more than ``max_bytes``,
+    the least recently used ones are deleted.
+    """
+
+    def __init__(self, root: Path, max_bytes: Optional[int] = None):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+
+    def chunk_path(self, extractor: FeatureExtractor, task, units: str) -> Path:
+        return (
+            self.root
+            / extractor.key
+            / f"s{task.session_id:02d}.t{int(task.task_id):02d}.{units}.npz"
+        )
+
+    def task_features(
+        self, extractor: FeatureExtractor, task, units: str = "ipu"
+    ) -> List[np.ndarray]:
+        """Features of each unit of ``task``, computing the ones not stored yet"""
+        units_of_task = task_units(task, units)
+        path = self.chunk_path(extractor, task, units)
+        stored = self._read(path)
+        computed = {}
+        features = []
+        for unit in units_of_task:
+            uid = unit_id(unit)
+            if uid not in stored and uid not in computed:
+                computed[uid] = extractor(unit)
+            features.append(stored[uid] if uid in stored else computed[uid])
+        if computed:
+            self._write(path, extractor, {**stored, **computed})
+        return features
+
+    def session_features(
+        self, extractor: FeatureExtractor, session, units: str = "ipu"
+    ) -> List[List[np.ndarray]]:
+        """``task_features`` of each task of ``session``.
+
+        Used as the unit of work of parallel extraction: the tasks of a
+        session share its wav files, which are then opened once per process.
+        """
+        return [self.task_features(extractor, task, units) for task in session.tasks]
+
+    def _read(self, path: Path) -> Dict[str, np.ndarray]:
+        if not path.exists():
+            return {}
+        try:
+            with np.load(path) as chunk:
+                stored = {name: chunk[name] for name in chunk.files}
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable feature chunk {path}: {e}")
+            return {}
+        # The modification time orders chunks for eviction
+        os.utime(path)
+        return stored
+
+    def _write(self, path: Path, extractor: FeatureExtractor, arrays):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        params_path = path.parent / "extractor.json"
+        if not params_path.exists():
+            with open(params_path, "w", encoding="utf-8") as f:
+                description = {
+                    "name": extractor.name,
+                    "sr": extractor.sr,
+                    "params": extractor.params,
+                }
+                json.dump(description, f, default=repr)
+        # Written whole to a temporary file, so a chunk is never left truncated
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}{TMP_SUFFIX}")
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+        self._evict(keep=path)
+
+    def _evict(self, keep: Path):
+        if self.max_bytes is None:
+            return
+        chunks = []
+        for chunk in self.root.glob("*/*.npz"):
+            if chunk.name.endswith(TMP_SUFFIX):
+                continue
+            try:
+                chunks.append((chunk, chunk.stat()))
+            except FileNotFoundError:
+                # Evicted meanwhile by another process sharing the store
+                continue
+        total = sum(stat.st_size for _, stat in chunks)
+        for chunk, stat in sorted(chunks, key=lambda item: item[1].st_mtime_ns):
+            if total <= self.max_bytes:
+                break
+            if chunk == keep:
+                continue
+            logging.info(f"Evicting feature chunk {chunk}")
+            chunk.unlink(missing_ok=True)
+            total -= stat.st_size
@@ -1,15 +1,98 @@
 """Parsing functions for the Games Corpus."""
 
+import io
 import logging
+import os
+import zipfile
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
 from pathlib import Path
-from typing import List, Dict
-from games_corpus_types import TurnTransition, Turn, IPU, Word, TurnTransitionType
+from typing import List, Dict, Iterable, Optional
+from games_corpus_types import (
+    IntervalIndex,
+    Registry,
+    TurnTransition,
+    Turn,
+    IPU,
+    Word,
+    TurnTransitionType,
+)
+
+
+class ZipMember:
+    """A file inside a zip archive, read without extracting it.
+
+    Used in place of a ``Path`` in the folder mappings, see ``index_zip``.
+    """
+
+    __slots__ = ("archive", "member")
+
+    def __init__(self, archive: Path, member: str):
+        self.archive = Path(archive)
+        self.member = member
+
+    @property
+    def name(self) -> str:
+        return self.member.rsplit("/", 1)[-1]
+
+    def open(self):
+        return io.TextIOWrapper(
+            _open_archive(self.archive).open(self.member), encoding="utf-8"
+        )
+
+    def __repr__(self) -> str:
+        return f"ZipMember({str(self.archive)!r}, {self.member!r})"
+
+
+# Archives opened by this process, keyed by process ID and path. Forked worker
+# processes must not share the file offset of their parent's archives.
+_open_archives: Dict[tuple, zipfile.ZipFile] = {}
+
+
+def _open_archive(archive: Path) -> zipfile.ZipFile:
+    key = (os.getpid(), archive)
+    if key not in _open_archives:
+        _open_archives[key] = zipfile.ZipFile(archive, "r")
+    return _open_archives[key]
+
+
+def close_archives(archives: Optional[Iterable[Path]] = None):
+    """Close the open archives, or only ``archives``; they reopen when read again"""
+    paths = None if archives is None else {Path(archive) for archive in archives}
+    # Archives inherited from a parent process are closed too, which only
+    # closes this process's copy of their file
+    for key in list(_open_archives):
+        if paths is None or key[1] in paths:
+            _open_archives.pop(key).close()
+
+
+def index_zip(archive: Path, folder_name: str) -> Dict[str, ZipMember]:
+    """Map the names of the files in ``folder_name`` inside ``archive`` to members.
+
+    Only the central directory of the archive is read. The result matches
+    the listing of the folder that extracting the archive would create.
+    """
+    prefix = f"{folder_name}/"
+    return {
+        member.filename[len(prefix) :]: ZipMember(archive, member.filename)
+        for member in _open_archive(Path(archive)).infolist()
+        if member.filename.startswith(prefix)
+        and not member.is_dir()
+        and "/" not in member.filename[len(prefix) :]
+    }
+
+
+def open_text(path):
+    """Open an annotation file, either a path or a ``ZipMember``"""
+    if isinstance(path, ZipMember):
+        return path.open()
+    return open(path, "r", encoding="utf-8")
 
 
 def load_tasks_info(tasks_file, batch):
     tasks_info = []
 
-    with open(tasks_file, "r", encoding="utf-8") as f:
+    with open_text(tasks_file) as f:
         for line in f:
             line = line.strip()
             if batch == 1:
@@ -53,18 +136,36 @@ def load_tasks_info(tasks_file, batch):
     return tasks_info
 
 
-def find_interlocutor_previous_turn_id(turns, speaker, starting_before=None):
-    """Find the most recent turn before the given timestamp"""
+def find_interlocutor_previous_turn(turns, speaker, starting_before=None):
+    """Find the most recent turn before the given timestamp
+
+    ``turns`` may be a list of turns sorted by start or a per-speaker
+    ``IntervalIndex`` mapping, as built by ``IntervalIndex.by_speaker``.
+    """
     if not turns:
         return None
 
+    if isinstance(turns, dict):
+        speaker_turns = turns.get(speaker)
+        return (
+            speaker_turns.last_starting_before(starting_before)
+            if speaker_turns
+            else None
+        )
+
     for turn in reversed(turns):
         if turn.start <= starting_before and turn.speaker == speaker:
-            return turn.turn_id
+            return turn
 
     return None
 
 
+def find_interlocutor_previous_turn_id(turns, speaker, starting_before=None):
+    """ID of the turn found by ``find_interlocutor_previous_turn``"""
+    turn = find_interlocutor_previous_turn(turns, speaker, starting_before)
+    return turn.turn_id if turn else None
+
+
 def find_turn_ipus(speaker_ipus, turn_start, turn_end, max_diff=0.1):
     """
     Find IPUs that fall within the given turn boundaries.
@@ -73,7 +174,13 @@ def find_turn_ipus(speaker_ipus, turn_start, turn_end, max_diff=0.1):
     greater than or equal to (turn_start - max_diff) and its end time is
     less than or equal to (turn_end + max_diff). IPUs that partially overlap
     with the boundaries but do not meet these conditions are excluded.
+
+    ``speaker_ipus`` may be a list of IPUs or an ``IntervalIndex`` built over
+    them; the index answers the same query by binary search.
     """
+    if isinstance(speaker_ipus, IntervalIndex):
+        return speaker_ipus.touching(turn_start - max_diff, turn_end + max_diff)
+
     turn_ipus = [
         ipu
         for ipu in speaker_ipus
@@ -99,6 +206,8 @@ def load_turns_for_task(
     batch: int,
     ipus: List[IPU],
     task_boundaries: tuple[int, int, int, int],
+    turns_lines: Optional[Dict[str, List[tuple]]] = None,
+    registry: Optional[Registry] = None,
 ) -> List[TurnTransition]:
     turns = []
 
@@ -107,8 +216,10 @@ def load_turns_for_task(
     if not ipus:
         return turns
 
-    task_start = task_boundaries[0]
-    task_end = task_boundaries[1]
+    if turns_lines is None:
+        turns_lines = load_turns_lines_for_task(
+            session_id, task_id, turns_folder, batch, task_boundaries
+        )
 
     # Create lookup dictionary for IPUs by speaker
     ipus_by_speaker = {}
@@ -116,60 +227,40 @@ def load_turns_for_task(
         if ipu.speaker not in ipus_by_speaker:
             ipus_by_speaker[ipu.speaker] = []
         ipus_by_speaker[ipu.speaker].append(ipu)
+    ipus_by_speaker = {
+        speaker: IntervalIndex(speaker_ipus)
+        for speaker, speaker_ipus in ipus_by_speaker.items()
+    }
+
+    # Process each speaker's turns
+    for speaker, lines in turns_lines.items():
+        for turn_start, turn_end, label in lines:
+            # Skip silence markers
+            if label == "#":
+                continue
 
-    # Process each speaker's turns file
-    for speaker, speaker_suffix in get_speaker_and_suffixes(batch):
-        turns_file_id = (
-            f"s{session_id:02d}.objects.1.{speaker_suffix}.turns"
-            if batch == 1
-            else f"s{session_id:02d}.objects.{task_id:02d}.{speaker_suffix}.turns"
-        )
-        turns_file = turns_folder.get(turns_file_id)
-        if not turns_file:
-            logging.warning(f"Turn file {turns_file_id} not found.")
-            continue
-
-        with open(turns_file, "r", encoding="utf-8") as f:
-            for line in f:
-                parts = line.strip().split()
-                if len(parts) != 3:
-                    continue
-
-                turn_start, turn_end, label = parts
-                turn_start, turn_end = float(turn_start), float(turn_end)
-
-                if turn_start > task_end:
-                    break
-                if turn_end < task_start:
-                    continue
-
-                # Skip silence markers
-                if label == "#":
-                    continue
-
-                turn_ipus = find_turn_ipus(
-                    ipus_by_speaker[speaker], turn_start, turn_end, max_diff=0.1
-                )
+            turn_ipus = find_turn_ipus(
+                ipus_by_speaker[speaker], turn_start, turn_end, max_diff=0.1
+            )
+            if len(turn_ipus) == 0:
                 turn_id = Turn.id_builder(
                     session_id, task_id, speaker, turn_start, turn_end
                 )
-                if len(turn_ipus) == 0:
-                    logging.warning(
-                        f"Cannot find IPUs for turn {turn_id}. Skipping turn"
-                    )
-                    continue
-
-                turn = Turn(
-                    ipu_ids=[
-                        ipu.ipu_id for ipu in turn_ipus
-                    ],  # Changed from ipus to ipu_ids
-                    speaker=speaker,
-                    session_id=session_id,
-                    task_id=task_id,
-                    start=turn_start,
-                    end=turn_end,
+                logging.warning(
+                    f"Cannot find IPUs for turn {turn_id}. Skipping turn"
                 )
-                turns.append(turn)
+                continue
+
+            turn = Turn(
+                ipus=turn_ipus,
+                speaker=speaker,
+                session_id=session_id,
+                task_id=task_id,
+                start=turn_start,
+                end=turn_end,
+                registry=registry,
+            )
+            turns.append(turn)
 
     return sorted(turns, key=lambda x: x.start)
 
@@ -181,6 +272,7 @@ def load_turn_transitions_for_task(
     batch: int,
     turns: List[IPU],
     task_boundaries: tuple[int, int, int, int],
+    turns_lines: Optional[Dict[str, List[tuple]]] = None,
 ) -> List[TurnTransition]:
     transitions = []
 
@@ -188,10 +280,126 @@ def load_turn_transitions_for_task(
     if not turns:
         return transitions
 
-    task_start = task_boundaries[0]
-    task_end = task_boundaries[1]
+    if turns_lines is None:
+        turns_lines = load_turns_lines_for_task(
+            session_id, task_id, turns_folder, batch, task_boundaries
+        )
+
+    turns_by_speaker = IntervalIndex.by_speaker(turns)
+    # Turns are matched to their lines by speaker and boundaries, which come
+    # from the same parsed lines
+    turns_by_bounds = {(turn.speaker, turn.start, turn.end): turn for turn in turns}
+
+    # Process each speaker's turns
+    for speaker, lines in turns_lines.items():
+        assert speaker in ["A", "B"]
+        interlocutor = "B" if speaker == "A" else "A"
+
+        for turn_start, turn_end, label in lines:
+            # Skip silence markers
+            if label == "#":
+                continue
+
+            if label in ["L", "L-SIM", "N", "N-SIM", "A"]:
+                logging.debug("Skipping undefined turn transitions")
+                continue
+
+            if (
+                label == TurnTransitionType.SIMULTANEOUS_START.value
+                or label == TurnTransitionType.FIRST_TURN.value
+            ):
+                prev_turn = None
+            else:
+                prev_turn = find_interlocutor_previous_turn(
+                    turns_by_speaker,
+                    speaker=interlocutor,
+                    starting_before=turn_start,
+                )
+                if not prev_turn:
+                    logging.warning(
+                        f"Could not find matching previous turn for: {(turn_start, turn_end, label)=}. Skipping Transition"
+                    )
+                    continue
+
+            turn = turns_by_bounds.get((speaker, turn_start, turn_end))
+            if turn is None:
+                turn_id = Turn.id_builder(
+                    session_id, task_id, speaker, turn_start, turn_end
+                )
+                logging.warning(
+                    f"Turn ID {turn_id} not found in loaded turns. Skipping transition."
+                )
+                continue
+
+            transition = TurnTransition(
+                label=label,
+                turn_from=prev_turn,
+                turn_to=turn,
+            )
+            transitions.append(transition)
+
+    return sorted(transitions, key=lambda x: x.ipu_to.start)
+
 
-    # Process each speaker's turns file
+class TimedLines:
+    """Lines of a timed annotation file, parsed once and sliced per task.
+
+    Each line is a ``(start, end, label)`` tuple. Slicing with ``window``
+    returns the same lines a scan from the top of the file would have kept
+    for a task: it stops at the first line starting after ``task_end`` and
+    skips lines ending before ``task_start``.
+    """
+
+    def __init__(self, lines: List[tuple]):
+        self.lines = lines
+        self._max_starts = list(accumulate((line[0] for line in lines), max))
+        self._max_ends = list(accumulate((line[1] for line in lines), max))
+
+    def window(self, task_start: float, task_end: float) -> List[tuple]:
+        lo = bisect_left(self._max_ends, task_start)
+        hi = bisect_right(self._max_starts, task_end)
+        return [line for line in self.lines[lo:hi] if line[1] >= task_start]
+
+
+def parse_words_file(words_file) -> TimedLines:
+    lines = []
+    with open_text(words_file) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            parts = line.split(" ")
+            if len(parts) == 2:
+                parts = [parts[0], parts[1], "#"]
+            else:
+                parts = [x for x in parts if x.strip() != ""]
+
+            t0, tf, text = parts
+            lines.append((float(t0), float(tf), text.strip()))
+
+    return TimedLines(lines)
+
+
+def parse_turns_file(turns_file) -> TimedLines:
+    lines = []
+    with open_text(turns_file) as f:
+        for line in f:
+            parts = line.strip().split()
+            if len(parts) != 3:
+                continue
+
+            turn_start, turn_end, label = parts
+            lines.append((float(turn_start), float(turn_end), label))
+
+    return TimedLines(lines)
+
+
+def load_turns_files(session_id, task_id, turns_folder, batch):
+    """Parse each speaker's turns file, keyed by speaker.
+
+    For batch 1 the files span the whole session and ``task_id`` is ignored.
+    """
+    turns_files = {}
     for speaker, speaker_suffix in get_speaker_and_suffixes(batch):
         turns_file_id = (
             f"s{session_id:02d}.objects.1.{speaker_suffix}.turns"
@@ -200,121 +408,112 @@ def load_turn_transitions_for_task(
         )
         turns_file = turns_folder.get(turns_file_id)
         if not turns_file:
-            logging.warning(f"Turn transitions file {turns_file_id} not found.")
+            logging.warning(f"Turn file {turns_file_id} not found.")
             continue
+        turns_files[speaker] = parse_turns_file(turns_file)
 
-        with open(turns_file, "r", encoding="utf-8") as f:
-            for line in f:
-                parts = line.strip().split()
-                if len(parts) != 3:
-                    continue
-
-                turn_start, turn_end, label = parts
-                turn_start, turn_end = float(turn_start), float(turn_end)
-
-                if turn_start > task_end:
-                    break
-                if turn_end < task_start:
-                    continue
+    return turns_files
 
-                assert speaker in ["A", "B"]
-                interlocutor = "B" if speaker == "A" else "A"
 
-                # Skip silence markers
-                if label == "#":
-                    continue
+def load_turns_lines_for_task(
+    session_id, task_id, turns_folder, batch, task_boundaries
+):
+    """Parse the turns files of a single task and keep the task's lines."""
+    turns_files = load_turns_files(session_id, task_id, turns_folder, batch)
+    return {
+        speaker: lines.window(task_boundaries[0], task_boundaries[1])
+        for speaker, lines in turns_files.items()
+    }
 
-                if label in ["L", "L-SIM", "N", "N-SIM", "A"]:
-                    logging.debug("Skipping undefined turn transitions")
-                    continue
 
-                if (
-                    label == TurnTransitionType.SIMULTANEOUS_START.value
-                    or label == TurnTransitionType.FIRST_TURN.value
-                ):
-                    prev_turn_id = None
-                else:
-                    prev_turn_id = find_interlocutor_previous_turn_id(
-                        turns,
-                        speaker=interlocutor,
-                        starting_before=turn_start,
-                    )
-                    if not prev_turn_id:
-                        logging.warning(
-                            f"Could not find matching previous turn for: {line.strip()=}. Skipping Transition"
-                        )
-                        continue
+def iter_turns_lines_for_session(session_id, tasks_info, turns_folder, batch):
+    """Yield each task's turns lines, keyed by speaker, one dict per task.
 
-                turn_id = Turn.id_builder(
-                    session_id, task_id, speaker, turn_start, turn_end
-                )
+    Batch 1 turns files span the whole session, so they are parsed once and
+    split by task. Batch 2 turns files are parsed when the task is requested.
+    """
+    if batch == 1:
+        turns_files = load_turns_files(session_id, None, turns_folder, batch)
+        for info in tasks_info:
+            yield {
+                speaker: lines.window(info["Start"], info["End"])
+                for speaker, lines in turns_files.items()
+            }
+    else:
+        for info in tasks_info:
+            yield load_turns_lines_for_task(
+                session_id,
+                info["Task ID"],
+                turns_folder,
+                batch,
+                (info["Start"], info["End"]),
+            )
 
-                if turn_id not in Turn._all_turns:
-                    logging.warning(
-                        f"Turn ID {turn_id} not found in loaded turns. Skipping transition."
-                    )
-                    continue
 
-                transition = TurnTransition(
-                    label=label,
-                    turn_id_from=prev_turn_id,
-                    turn_id_to=turn_id,
-                )
-                transitions.append(transition)
+def build_ipus_from_words(word_lines, speaker, registry=None):
+    ipus = []
+    words = []
+    for t0, tf, text in word_lines:
+        if text == "#":
+            if words:
+                ipus.append(IPU(words=words, registry=registry))
+                words = []
+        else:
+            words.append(Word(start=t0, end=tf, text=text, speaker=speaker))
+    if words:
+        ipus.append(IPU(words=words, registry=registry))
 
-    return sorted(transitions, key=lambda x: x.ipu_to.start)
+    return ipus
 
 
-def load_ipus_from_words(session_id, task_boundaries, words_folder):
-    task_start = task_boundaries[0]
-    task_end = task_boundaries[1]
-    all_ipus = []
+def iter_ipus_from_words_for_session(
+    session_id, tasks_boundaries, words_folder, registry=None
+):
+    """Yield the IPUs of every task in a batch 1 session, one list per task.
 
+    Each speaker's words file is read once, and its lines are then split
+    across the given task boundaries as each task is requested.
+    """
+    word_lines_by_speaker = {}
     for speaker in ["A", "B"]:
         words_file_id = f"s{session_id:02d}.objects.1.{speaker}.words"
-        words_file = words_folder[words_file_id]
-
-        words = []
-        with open(words_file, "r", encoding="utf-8") as f:
-            for line in f:
-                line = line.strip()
-                parts = line.split(" ")
-                if len(parts) == 2:
-                    parts = [parts[0], parts[1], "#"]
-                else:
-                    parts = [x for x in parts if x.strip() != ""]
-
-                t0, tf, text = parts
-                t0 = float(t0)
-                tf = float(tf)
-                text = text.strip()
-
-                if t0 > task_end:
-                    break
-
-                if tf < task_start:
-                    continue
+        word_lines_by_speaker[speaker] = parse_words_file(words_folder[words_file_id])
+
+    for task_boundaries in tasks_boundaries:
+        task_start = task_boundaries[0]
+        task_end = task_boundaries[1]
+        task_ipus = []
+        for speaker, word_lines in word_lines_by_speaker.items():
+            task_ipus.extend(
+                build_ipus_from_words(
+                    word_lines.window(task_start, task_end), speaker, registry
+                )
+            )
+        yield task_ipus
 
-                if text.strip() == "#":
-                    if words:
-                        all_ipus.append(IPU(words=words))
-                        words = []
-                else:
-                    words.append(
-                        Word(
-                            start=float(t0),
-                            end=float(tf),
-                            text=text.strip(),
-                            speaker=speaker,
-                        )
-                    )
-            if words:
-                all_ipus.append(IPU(words=words))
 
-    return all_ipus
+def load_ipus_from_words_for_session(
+    session_id, tasks_boundaries, words_folder, registry=None
+):
+    """Load the IPUs of every task in a batch 1 session.
+
+    Returns one list of IPUs per entry in ``tasks_boundaries``, in the same
+    order.
+    """
+    return list(
+        iter_ipus_from_words_for_session(
+            session_id, tasks_boundaries, words_folder, registry
+        )
+    )
+
 
+def load_ipus_from_words(session_id, task_boundaries, words_folder, registry=None):
+    return load_ipus_from_words_for_session(
+        session_id, [task_boundaries], words_folder, registry
+    )[0]
 
-def load_ipus_from_phrases(session_id, task_id, phrases_folder, batch):
+
+def load_ipus_from_phrases(session_id, task_id, phrases_folder, batch, registry=None):
     all_ipus = []
     for speaker, speaker_suffix in get_speaker_and_suffixes(batch):
         ipus_file_id = (
@@ -331,7 +530,7 @@ def load_ipus_from_phrases(session_id, task_id, phrases_folder, batch):
             words_by_ipu = []
             current_words = []
 
-            with open(ipus_file, "r", encoding="utf-8") as f:
+            with open_text(ipus_file) as f:
                 for line in f:
                     line = line.strip()
                     try:
@@ -372,7 +571,9 @@ def load_ipus_from_phrases(session_id, task_id, phrases_folder, batch):
                 words_by_ipu.append(current_words)
 
             # Create IPUs from word groups
-            all_ipus.extend([IPU(words=words) for words in words_by_ipu])
+            all_ipus.extend(
+                [IPU(words=words, registry=registry) for words in words_by_ipu]
+            )
 
         except Exception as e:
             logging.error(f"Error processing file {ipus_file_id}: {e}")
@@ -381,16 +582,27 @@ def load_ipus_from_phrases(session_id, task_id, phrases_folder, batch):
     return sorted(all_ipus, key=lambda x: x.start)
 
 
-def load_wavs_for_task(session_id, task_id, wav_folder, batch):
-    wavs = {}
+def wav_file_ids_for_task(session_id, task_id, batch) -> Dict[str, str]:
+    """Names of the wav files of a task, keyed by speaker.
+
+    For batch 1 the files span the whole session.
+    """
+    wav_file_ids = {}
     for speaker, speaker_suffix in get_speaker_and_suffixes(batch):
         if batch == 1:
-            wav_file_id = f"s{session_id:02d}.objects.1.{speaker_suffix}.wav"
+            wav_file_ids[speaker] = f"s{session_id:02d}.objects.1.{speaker_suffix}.wav"
         elif batch == 2:
-            wav_file_id = (
+            wav_file_ids[speaker] = (
                 f"s{session_id:02d}.objects.{task_id:02d}.{speaker_suffix}.wav"
             )
+    return wav_file_ids
+
 
+def load_wavs_for_task(session_id, task_id, wav_folder, batch):
+    wavs = {}
+    for speaker, wav_file_id in wav_file_ids_for_task(
+        session_id, task_id, batch
+    ).items():
         if wav_folder:
             wav_file = wav_folder.get(wav_file_id)
             if not wav_file:
@@ -402,11 +614,42 @@ def load_wavs_for_task(session_id, task_id, wav_folder, batch):
 
 
 def load_ipus_for_task(
-    session_id, task_id, task_boundaries, phrases_folder, words_folder, batch
+    session_id,
+    task_id,
+    task_boundaries,
+    phrases_folder,
+    words_folder,
+    batch,
+    registry=None,
 ):
     if batch == 2:
-        ipus = load_ipus_from_phrases(session_id, task_id, phrases_folder, batch)
+        ipus = load_ipus_from_phrases(
+            session_id, task_id, phrases_folder, batch, registry
+        )
     elif batch == 1:
-        ipus = load_ipus_from_words(session_id, task_boundaries, words_folder)
+        ipus = load_ipus_from_words(
+            session_id, task_boundaries, words_folder, registry
+        )
 
     return ipus
+
+
+def iter_ipus_for_session(
+    session_id, tasks_info, phrases_folder, words_folder, batch, registry=None
+):
+    """Yield the IPUs of every task in a session, one list per task.
+
+    Batch 1 words files span the whole session, so they are read once and
+    split by task. Batch 2 phrases files are per task and are only read when
+    the next task is requested.
+    """
+    if batch == 1:
+        tasks_boundaries = [(info["Start"], info["End"]) for info in tasks_info]
+        yield from iter_ipus_from_words_for_session(
+            session_id, tasks_boundaries, words_folder, registry
+        )
+    else:
+        for info in tasks_info:
+            yield load_ipus_from_phrases(
+                session_id, info["Task ID"], phrases_folder, batch, registry
+            )
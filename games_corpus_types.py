@@ -1,9 +1,12 @@
 """Shared types and data classes for the Games Corpus"""
 
+from bisect import bisect_left, bisect_right
 from dataclasses import dataclass, field
 from typing import List, Optional, Dict, Set, Tuple
 from enum import Enum
+from functools import cached_property
 import logging
+import weakref
 
 
 class TurnTransitionType(Enum):
@@ -40,7 +43,132 @@ class TurnTransitionType(Enum):
         return "Transition " + self.value
 
 
-@dataclass(frozen=True)
+class Registry:
+    """ID lookup tables for the IPUs, turns and sessions of one corpus.
+
+    Each corpus owns its own registry, so its objects are freed together
+    with it and IDs from different corpora never overwrite each other.
+    Objects built without a registry use the default one, which is the
+    registry of the most recently loaded corpus while that corpus is alive,
+    and a process-wide registry otherwise.
+    """
+
+    _fallback: "Registry" = None
+    _default_ref = None
+
+    def __init__(self):
+        self.ipus: Dict[str, "IPU"] = {}
+        self.turns: Dict[str, "Turn"] = {}
+        self.sessions: Dict[int, "Session"] = {}
+
+    @classmethod
+    def default(cls) -> "Registry":
+        registry = cls._default_ref() if cls._default_ref else None
+        if registry is None:
+            if cls._fallback is None:
+                cls._fallback = cls()
+            registry = cls._fallback
+        return registry
+
+    @classmethod
+    def set_default(cls, registry: "Registry"):
+        """Use ``registry`` for class-level lookups, without keeping it alive"""
+        cls._default_ref = weakref.ref(registry)
+
+    def get_ipu_by_id(self, ipu_id: str) -> Optional["IPU"]:
+        return self.ipus.get(ipu_id)
+
+    def get_turn_by_id(self, turn_id: str) -> Optional["Turn"]:
+        return self.turns[turn_id]
+
+    def get_session_by_id(self, session_id: int) -> Optional["Session"]:
+        return self.sessions.get(session_id)
+
+    def clear(self):
+        self.ipus.clear()
+        self.turns.clear()
+        self.sessions.clear()
+
+
+class IntervalIndex:
+    """Sorted start/end index over items that have ``start`` and ``end``.
+
+    Built once per list of items so that time-range lookups are answered by
+    binary search instead of scanning every item. Results keep the order of
+    the items passed in.
+    """
+
+    def __init__(self, items):
+        self.items = list(items)
+        self._by_start = sorted(
+            range(len(self.items)), key=lambda i: self.items[i].start
+        )
+        self._by_end = sorted(range(len(self.items)), key=lambda i: self.items[i].end)
+        self._starts = [self.items[i].start for i in self._by_start]
+        self._ends = [self.items[i].end for i in self._by_end]
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def touching(self, lo: float, hi: float) -> list:
+        """Items whose start or end falls within ``[lo, hi]``."""
+        start_lo = bisect_left(self._starts, lo)
+        start_hi = bisect_right(self._starts, hi)
+        end_lo = bisect_left(self._ends, lo)
+        end_hi = bisect_right(self._ends, hi)
+        positions = set(self._by_start[start_lo:start_hi])
+        positions.update(self._by_end[end_lo:end_hi])
+        return [self.items[i] for i in sorted(positions)]
+
+    def last_starting_before(self, t: float):
+        """Latest-starting item with ``start <= t``, or None.
+
+        Ties on start resolve to the item that comes last in the original
+        order.
+        """
+        i = bisect_right(self._starts, t)
+        if i == 0:
+            return None
+        return self.items[self._by_start[i - 1]]
+
+    @classmethod
+    def by_speaker(cls, items) -> Dict[str, "IntervalIndex"]:
+        """Build one index per speaker over items that have a ``speaker``."""
+        items_by_speaker = {}
+        for item in items:
+            items_by_speaker.setdefault(item.speaker, []).append(item)
+        return {
+            speaker: cls(speaker_items)
+            for speaker, speaker_items in items_by_speaker.items()
+        }
+
+
+def _getstate_without_registry(self):
+    # The registry is not pickled along; register() attaches one again
+    state = {
+        name: getattr(self, name) for name in self.__slots__ if hasattr(self, name)
+    }
+    state["registry"] = None
+    return state
+
+
+def _setstate(self, state):
+    for name, value in state.items():
+        object.__setattr__(self, name, value)
+
+
+def _segment_audio(unit, channel, start, end, sr):
+    if unit.task is None:
+        raise RuntimeError(f"{unit} is not part of a task, so it has no audio")
+    # The audio stack is only needed once audio is read
+    import games_corpus_audio
+
+    return games_corpus_audio.read_segment(
+        unit.task.wavs[channel or unit.speaker], start, end, sr
+    )
+
+
+@dataclass(frozen=True, slots=True)
 class Word:
     start: float
     end: float
@@ -55,111 +183,181 @@ class Word:
         return self.text
 
 
-@dataclass
+@dataclass(slots=True)
 class IPU:
-    # Class-level storage
-    _all_ipus = {}
-
     words: List[Word]
     speaker: str = field(init=False)
     start: float = field(init=False)
     end: float = field(init=False)
     duration: float = field(init=False)
-    text: str = field(init=False)
     num_words: int = field(init=False)
+    registry: Optional[Registry] = field(default=None, repr=False, compare=False)
+    _text: Optional[str] = field(init=False, default=None, repr=False, compare=False)
+    _ipu_id: Optional[str] = field(
+        init=False, default=None, repr=False, compare=False
+    )
+    # Set by the Task that holds it
+    task: Optional["Task"] = field(
+        init=False, default=None, repr=False, compare=False
+    )
 
     @classmethod
     def id_builder(cls, speaker: str, start: float, end: float) -> str:
         return f"ipu_{speaker}_{start:.2f}_{end:.2f}"
 
+    @property
+    def ipu_id(self) -> str:
+        """ID of the IPU, formatted once on first access"""
+        if self._ipu_id is None:
+            self._ipu_id = IPU.id_builder(self.speaker, self.start, self.end)
+        return self._ipu_id
+
+    @property
+    def text(self) -> str:
+        """Words of the IPU joined by spaces, built on first access"""
+        if self._text is None:
+            self._text = " ".join(word.text for word in self.words)
+        return self._text
+
+    def audio(self, channel: Optional[str] = None, sr: Optional[int] = None):
+        """Audio of this IPU from the wav of ``channel``, its speaker's by default.
+
+        See ``games_corpus_audio.read_segment`` for the returned samples.
+        """
+        return _segment_audio(self, channel, self.start, self.end, sr)
+
     @classmethod
     def get_ipu_by_id(cls, ipu_id: str) -> Optional["IPU"]:
-        return cls._all_ipus.get(ipu_id)
+        return Registry.default().get_ipu_by_id(ipu_id)
 
     @classmethod
     def clear_registry(cls):
-        """Clear the IPUs registry"""
-        cls._all_ipus.clear()
+        """Clear the IPUs of the default registry"""
+        Registry.default().ipus.clear()
+
+    def register(self, registry: Optional[Registry] = None):
+        """Add this IPU to ``registry``, or to its own registry"""
+        self.registry = registry or self.registry or Registry.default()
+        self.registry.ipus[self.ipu_id] = self
+
+    def unregister(self):
+        """Remove this IPU from its registry, unless another IPU replaced it"""
+        if self.registry and self.registry.ipus.get(self.ipu_id) is self:
+            del self.registry.ipus[self.ipu_id]
 
     def __post_init__(self):
         self.start = self.words[0].start
         self.end = self.words[-1].end
         self.speaker = self.words[0].speaker
         self.duration = self.end - self.start
-        self.text = " ".join(word.text for word in self.words)
         self.num_words = len(self.words)
 
         # Register this IPU
-        self.ipu_id = IPU.id_builder(self.speaker, self.start, self.end)
-        IPU._all_ipus[self.ipu_id] = self
+        self.register()
+
+    __getstate__ = _getstate_without_registry
+    __setstate__ = _setstate
 
     def __str__(self) -> str:
         return f"[IPU ({self.speaker}) {self.start:.02f}:{self.end:.02f} ] {self.text}"
 
 
-@dataclass
+@dataclass(slots=True)
 class Turn:
     session_id: int
     task_id: int
-    ipu_ids: List[str]  # Changed from ipus to ipu_ids
+    ipus: List[IPU]
     speaker: str
     start: float
     end: float
     duration: float = field(init=False)
-    text: str = field(init=False)
     num_words: int = field(init=False)
-
-    # Class-level storage (outside the dataclass fields)
-    _all_turns = {}
+    registry: Optional[Registry] = field(default=None, repr=False, compare=False)
+    _text: Optional[str] = field(init=False, default=None, repr=False, compare=False)
+    _turn_id: Optional[str] = field(
+        init=False, default=None, repr=False, compare=False
+    )
+    # Set by the Task that holds it
+    task: Optional["Task"] = field(
+        init=False, default=None, repr=False, compare=False
+    )
 
     @classmethod
     def get_turn_by_id(cls, turn_id: str) -> Optional["Turn"]:
-        return cls._all_turns[turn_id]
+        return Registry.default().get_turn_by_id(turn_id)
 
     @classmethod
     def clear_registry(cls):
-        """Clear the turns registry"""
-        cls._all_turns.clear()
+        """Clear the turns of the default registry"""
+        Registry.default().turns.clear()
+
+    def register(self, registry: Optional[Registry] = None):
+        """Add this turn to ``registry``, or to its own registry"""
+        self.registry = registry or self.registry or Registry.default()
+        self.registry.turns[self.turn_id] = self
+
+    def unregister(self):
+        """Remove this turn from its registry, unless another turn replaced it"""
+        if self.registry and self.registry.turns.get(self.turn_id) is self:
+            del self.registry.turns[self.turn_id]
 
     @classmethod
     def id_builder(cls, session_id, task_id, speaker, turn_start, turn_end):
         return f"turn_{session_id:02d}_{task_id:02d}_{speaker}_{turn_start:.2f}_{turn_end:.2f}"
 
     @property
-    def ipus(self) -> List[IPU]:
-        """Get IPUs from their IDs"""
-        return [IPU.get_ipu_by_id(ipu_id) for ipu_id in self.ipu_ids]
+    def turn_id(self) -> str:
+        """ID of the turn, formatted once on first access"""
+        if self._turn_id is None:
+            self._turn_id = Turn.id_builder(
+                self.session_id, self.task_id, self.speaker, self.start, self.end
+            )
+        return self._turn_id
+
+    @property
+    def ipu_ids(self) -> List[str]:
+        return [ipu.ipu_id for ipu in self.ipus]
+
+    @property
+    def text(self) -> str:
+        """Turn header followed by the text of its IPUs, built on first access"""
+        if self._text is None:
+            self._text = (
+                f"[Turn ({self.speaker}) {self.start:.02f}:{self.end:.02f} ] \t "
+                + " ".join(ipu.text for ipu in self.ipus)
+            )
+        return self._text
+
+    def audio(self, channel: Optional[str] = None, sr: Optional[int] = None):
+        """Audio of this turn from the wav of ``channel``, its speaker's by default.
+
+        See ``games_corpus_audio.read_segment`` for the returned samples.
+        """
+        return _segment_audio(self, channel, self.start, self.end, sr)
 
     def __post_init__(self):
-        if not self.ipu_ids:  # Changed from ipus to ipu_ids
+        if not self.ipus:
             raise ValueError("IPUs list cannot be empty")
 
-        self.turn_id = Turn.id_builder(
-            self.session_id, self.task_id, self.speaker, self.start, self.end
-        )
-
         # Register this turn
-        Turn._all_turns[self.turn_id] = self
+        self.register()
 
         self.duration = self.end - self.start
-        self.text = (
-            f"[Turn ({self.speaker}) {self.start:.02f}:{self.end:.02f} ] \t "
-            + " ".join(ipu.text for ipu in self.ipus)  # Using the property
-        )
-        self.num_words = sum(ipu.num_words for ipu in self.ipus)  # Using the property
+        self.num_words = sum(ipu.num_words for ipu in self.ipus)
+
+    __getstate__ = _getstate_without_registry
+    __setstate__ = _setstate
 
     def __str__(self) -> str:
         return self.text
 
 
-@dataclass
+@dataclass(slots=True)
 class TurnTransition:
     label: str
-    turn_id_from: Optional[str] = field()
-    turn_id_to: str = field()
+    turn_from: Optional[Turn]
+    turn_to: Turn
 
-    turn_from: Optional[Turn] = field(init=False)
-    turn_to: Turn = field(init=False)
     ipu_from: Optional[IPU] = field(init=False)
     ipu_to: IPU = field(init=False)
     speaker_from: Optional[str] = field(init=False)
@@ -170,14 +368,17 @@ class TurnTransition:
     transition_duration: float = field(init=False)
     overlapped_transition: bool = field(init=False)
 
+    @property
+    def turn_id_from(self) -> Optional[str]:
+        return self.turn_from.turn_id if self.turn_from else None
+
+    @property
+    def turn_id_to(self) -> str:
+        return self.turn_to.turn_id
+
     def __post_init__(self):
         self.label_type = TurnTransitionType.from_string(self.label)
 
-        self.turn_from = (
-            Turn.get_turn_by_id(self.turn_id_from) if self.turn_id_from else None
-        )
-        self.turn_to = Turn.get_turn_by_id(self.turn_id_to)
-
         self.speaker_from = self.turn_from.speaker if self.turn_from else None
         self.speaker_to = self.turn_to.speaker
         self.session_id = self.turn_to.session_id
@@ -206,12 +407,66 @@ class Task:
     wavs: Dict[str, str]
     start: float
     duration: float
-    text: str = field(init=False)
+    _turns_index: Optional[Dict[str, IntervalIndex]] = field(
+        init=False, default=None, repr=False, compare=False
+    )
+    # Set by games_corpus_columnar.to_columnar
+    columns: Optional["TaskColumns"] = field(
+        init=False, default=None, repr=False, compare=False
+    )
+    # Filled by games_corpus_columnar.vad_matrices, by frame rate and speakers
+    vad_cache: Dict[tuple, "np.ndarray"] = field(
+        init=False, default_factory=dict, repr=False, compare=False
+    )
 
     def __post_init__(self):
         self.score = float(self.score)
         self.ipus = sorted(self.ipus, key=lambda x: x.start) if self.ipus else []
-        self.text = self._build_text()
+        for unit in (*self.ipus, *self.turns):
+            unit.task = self
+
+    @cached_property
+    def text(self) -> str:
+        """All the IPUs of the task, one per line, built on first access"""
+        return self._build_text()
+
+    def audio(self, channel: str, sr: Optional[int] = None):
+        """Audio of this task from the wav of ``channel``.
+
+        See ``games_corpus_audio.read_segment`` for the returned samples.
+        """
+        import games_corpus_audio
+
+        return games_corpus_audio.read_segment(
+            self.wavs[channel], self.start, self.start + self.duration, sr
+        )
+
+    def transition_windows(
+        self, before: float = 2.0, after: float = 1.0, sr: Optional[int] = None
+    ):
+        """Audio of both channels around each turn transition of this task.
+
+        See ``games_corpus_audio.transition_windows``.
+        """
+        import games_corpus_audio
+
+        return games_corpus_audio.transition_windows([self], before, after, sr)
+
+    def vad_matrix(self, frame_hz: float = 50, speakers=("A", "B")):
+        """Voice activity of ``speakers`` in frames of ``1 / frame_hz`` seconds.
+
+        See ``games_corpus_columnar.vad_matrices``. Requires NumPy.
+        """
+        import games_corpus_columnar
+
+        return games_corpus_columnar.vad_matrices([self], frame_hz, speakers)[0]
+
+    def previous_turn(self, speaker: str, before: float) -> Optional[Turn]:
+        """Get the latest turn by ``speaker`` that starts at or before ``before``"""
+        if self._turns_index is None:
+            self._turns_index = IntervalIndex.by_speaker(self.turns)
+        speaker_turns = self._turns_index.get(speaker)
+        return speaker_turns.last_starting_before(before) if speaker_turns else None
 
     def _build_text(self) -> str:
         if not self.ipus:
@@ -238,22 +493,39 @@ class Session:
     subject_a: str
     subject_b: str
     tasks: List[Task]
-
-    # Class-level storage (outside the dataclass fields)
-    _all_sessions = {}
+    registry: Optional[Registry] = field(default=None, repr=False, compare=False)
 
     def __post_init__(self):
         # Register this session
-        Session._all_sessions[self.session_id] = self
+        object.__setattr__(self, "registry", self.registry or Registry.default())
+        self.registry.sessions[self.session_id] = self
+
+    def register(self, registry: Registry):
+        """Add this session and its IPUs and turns to ``registry``.
+
+        Used for sessions built in another process or read from a cache,
+        whose registrations did not happen in ``registry``.
+        """
+        object.__setattr__(self, "registry", registry)
+        registry.sessions[self.session_id] = self
+        for task in self.tasks:
+            for ipu in task.ipus:
+                ipu.register(registry)
+            for turn in task.turns:
+                turn.register(registry)
 
     @classmethod
     def get_session_by_id(cls, session_id: int) -> Optional["Session"]:
-        return cls._all_sessions.get(session_id)
+        return Registry.default().get_session_by_id(session_id)
 
     @classmethod
     def clear_registry(cls):
-        """Clear the sessions registry"""
-        cls._all_sessions.clear()
+        """Clear the sessions of the default registry"""
+        Registry.default().sessions.clear()
+
+    def __getstate__(self):
+        # The registry is not pickled along; register() attaches one again
+        return {**self.__dict__, "registry": None}
 
     def __str__(self) -> str:
         return f"[Session {self.session_id} ({self.subject_a}, {self.subject_b})] (tasks_count: {len(self.tasks)})"
@@ -291,3 +563,8 @@ class BatchConfig:
 
     def is_heldout_session(self, session_id: int) -> bool:
         return session_id in self.heldout_sessions
+
+    def is_heldout(self, session_id: int, task_id: int) -> bool:
+        return self.is_heldout_session(session_id) or self.is_heldout_task(
+            session_id, task_id
+        )
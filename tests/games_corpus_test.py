@@ -1,6 +1,21 @@
 import sys
 from pathlib import Path
+import array
+import gc
+import hashlib
+import io
+import logging
 import math
+import os
+import pickle
+import shutil
+import threading
+import time
+import wave
+import weakref
+import zipfile
+from types import SimpleNamespace
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 REPO_ROOT = Path(__file__).resolve().parents[2]
 GAMES_CORPUS_PATH = REPO_ROOT / "games-corpus"
@@ -9,12 +24,16 @@ if str(GAMES_CORPUS_PATH) not in sys.path:
     sys.path.append(str(GAMES_CORPUS_PATH))
 
 import pytest
+import games_corpus
 from games_corpus import (
+    CorpusDownloader,
+    FileChecksum,
     SpanishGamesCorpusDialogues,
     Task,
     Session,
 )
 from games_corpus_types import (
+    IntervalIndex,
     Word,
     IPU,
     TurnTransition,
@@ -22,7 +41,24 @@ from games_corpus_types import (
     TurnTransitionType,
 )
 
-from games_corpus_parsers import load_tasks_info, load_ipus_from_words, load_turns_for_task
+import games_corpus_audio
+import games_corpus_parsers
+from games_corpus_audio import (
+    WavFile,
+    audio_batches,
+    plan_batches,
+    resample_wav,
+    resampled_path,
+    write_wav,
+)
+from games_corpus_parsers import (
+    load_tasks_info,
+    load_ipus_from_words,
+    load_ipus_from_words_for_session,
+    load_turns_for_task,
+    iter_turns_lines_for_session,
+    find_turn_ipus,
+)
 
 
 @pytest.fixture
@@ -34,6 +70,204 @@ def sample_task_file(tmp_path):
     return task_file
 
 
+@pytest.fixture
+def sample_words_folder(tmp_path):
+    words_a = tmp_path / "s01.objects.1.A.words"
+    words_a.write_text(
+        "0.0 1.0 #\n"
+        "1.0 1.5 hola\n"
+        "1.5 2.0 che\n"
+        "2.0 4.0\n"
+        "4.0 4.5 mono\n"
+        "4.5  6.0 arriba\n"
+        "6.0 9.0 #\n"
+        "9.0 9.5 bien\n"
+    )
+    words_b = tmp_path / "s01.objects.1.B.words"
+    words_b.write_text("0.0 3.0 #\n3.0 3.5 sí\n3.5 9.5 #\n")
+    return {
+        "s01.objects.1.A.words": words_a,
+        "s01.objects.1.B.words": words_b,
+    }
+
+
+@pytest.fixture
+def sample_turns_folder(tmp_path):
+    turns_a = tmp_path / "s01.objects.1.A.turns"
+    turns_a.write_text("0.0 1.0 #\n1.0 2.0 X1\n2.0 4.0 #\n4.0 6.0 S\n6.0 9.5 #\n")
+    turns_b = tmp_path / "s01.objects.1.B.turns"
+    turns_b.write_text("0.0 3.0 #\n3.0 3.5 BC\n3.5 9.5 #\n")
+    return {
+        "s01.objects.1.A.turns": turns_a,
+        "s01.objects.1.B.turns": turns_b,
+    }
+
+
+SAMPLE_CORPUS_FILES = {
+    "sessions-info.csv": (
+        "session_id,batch,subject_id_A,subject_id_B\n1,1,S1a,S1b\n15,2,S15a,S15b\n"
+    ),
+    "subjects-info.csv": "subject_id\nS1a\nS1b\nS15a\nS15b\n",
+    "b1-dialogue-tasks/s01.objects.1.tasks": (
+        "0.0 10.0 Images:img1,img2;Describer:A;Target:img1;Score:1.0;Time-used:10.0\n"
+        "10.0 20.0 Images:img3,img4;Describer:B;Target:img3;Score:0.5;Time-used:10.0\n"
+    ),
+    "b1-dialogue-words/s01.objects.1.A.words": (
+        "0.0 1.0 #\n1.0 1.5 hola\n1.5 2.0 che\n2.0 4.0\n4.0 4.5 mono\n"
+        "4.5 6.0 arriba\n6.0 11.0 #\n11.0 12.0 bueno\n12.0 20.0 #\n"
+    ),
+    "b1-dialogue-words/s01.objects.1.B.words": (
+        "0.0 3.0 #\n3.0 3.5 sí\n3.5 12.5 #\n12.5 13.0 dale\n13.0 13.5 listo\n"
+        "13.5 20.0 #\n"
+    ),
+    "b1-dialogue-turns/s01.objects.1.A.turns": (
+        "0.0 1.0 #\n1.0 2.0 X1\n2.0 4.0 #\n4.0 6.0 S\n6.0 11.0 #\n11.0 12.0 X1\n"
+        "12.0 20.0 #\n"
+    ),
+    "b1-dialogue-turns/s01.objects.1.B.turns": (
+        "0.0 3.0 #\n3.0 3.5 BC\n3.5 12.5 #\n12.5 13.5 S\n13.5 20.0 #\n"
+    ),
+    "b2-dialogue-tasks/s15.objects.tasks": (
+        "1 Images:img1,img2;Describer:A;Target:img1;Score:1.0;Time-used:5.0\n"
+        "2 Images:img3,img4;Describer:B;Target:img4;Score:0.0;Time-used:4.0\n"
+    ),
+    "b2-dialogue-phrases/s15.objects.01.channel1.phrases": (
+        "0.0\t0.5\t#\n0.5\t1.5\thola che\n1.5\t5.0\t#\n"
+    ),
+    "b2-dialogue-phrases/s15.objects.01.channel2.phrases": (
+        "0.0\t2.0\t#\n2.0\t2.5\tsí\n2.5\t5.0\t#\n"
+    ),
+    "b2-dialogue-phrases/s15.objects.02.channel1.phrases": (
+        "0.0\t1.0\t#\n1.0\t2.0\tel mono\n2.0\t4.0\t#\n"
+    ),
+    "b2-dialogue-phrases/s15.objects.02.channel2.phrases": (
+        "0.0\t2.2\t#\n2.2\t3.0\tarriba\n3.0\t4.0\t#\n"
+    ),
+    "b2-dialogue-turns/s15.objects.01.channel1.turns": (
+        "0.0 0.5 #\n0.5 1.5 X1\n1.5 5.0 #\n"
+    ),
+    "b2-dialogue-turns/s15.objects.01.channel2.turns": (
+        "0.0 2.0 #\n2.0 2.5 S\n2.5 5.0 #\n"
+    ),
+    "b2-dialogue-turns/s15.objects.02.channel1.turns": (
+        "0.0 1.0 #\n1.0 2.0 X1\n2.0 4.0 #\n"
+    ),
+    "b2-dialogue-turns/s15.objects.02.channel2.turns": (
+        "0.0 2.2 #\n2.2 3.0 O\n3.0 4.0 #\n"
+    ),
+}
+
+
+@pytest.fixture
+def sample_corpus_path(tmp_path):
+    """A small extracted corpus with one session per batch."""
+    corpus_path = tmp_path / "corpus"
+    for folder in [
+        "b1-dialogue-phrases",
+        "b1-dialogue-tasks",
+        "b1-dialogue-turns",
+        "b1-dialogue-words",
+        "b2-dialogue-phrases",
+        "b2-dialogue-tasks",
+        "b2-dialogue-turns",
+    ]:
+        (corpus_path / folder).mkdir(parents=True)
+    for file_name, content in SAMPLE_CORPUS_FILES.items():
+        (corpus_path / file_name).write_text(content, encoding="utf-8")
+    return corpus_path
+
+
+class FileServer(ThreadingHTTPServer):
+    """Local HTTP server for ``files``, with Range support.
+
+    The first response for a name in ``drop_after`` is cut after that many
+    bytes, as an interrupted connection would.
+    """
+
+    def __init__(self, files):
+        super().__init__(("127.0.0.1", 0), FileRequestHandler)
+        self.files = files
+        self.drop_after = {}
+        self.requests = []
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_port}/{{filename}}"
+
+
+class FileRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        name = self.path.lstrip("/")
+        range_header = self.headers.get("Range")
+        self.server.requests.append((name, range_header))
+        if name not in self.server.files:
+            self.send_error(404)
+            return
+        content = self.server.files[name]
+        start, end = 0, len(content) - 1
+        if range_header:
+            first, last = range_header[len("bytes=") :].split("-")
+            start, end = int(first), int(last) if last else end
+        self.send_response(206 if range_header else 200)
+        self.send_header("Content-Length", str(end + 1 - start))
+        if range_header:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(content)}")
+        self.end_headers()
+        drop_after = self.server.drop_after.pop(name, None)
+        self.wfile.write(content[start : end + 1][:drop_after])
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def file_server():
+    server = FileServer({})
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def add_sample_wavs(task, folder, samplerate=100):
+    """Give each speaker of ``task`` a 16-bit wav whose samples count up from 0"""
+    folder.mkdir(parents=True, exist_ok=True)
+    for speaker in ("A", "B"):
+        path = folder / f"{speaker}.wav"
+        with wave.open(str(path), "wb") as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(samplerate)
+            wav.writeframes(array.array("h", range(1000)).tobytes())
+        task.wavs[speaker] = path
+
+
+def corpus_summary(corpus):
+    """Plain-data view of a loaded corpus, for comparing loads."""
+    return [
+        (
+            session.session_id,
+            session.batch,
+            [
+                (
+                    task.task_id,
+                    task.start,
+                    task.duration,
+                    [ipu.ipu_id for ipu in task.ipus],
+                    [(turn.turn_id, turn.text) for turn in task.turns],
+                    [
+                        (trans.label, trans.turn_id_from, trans.turn_id_to)
+                        for trans in task.turn_transitions
+                    ],
+                )
+                for task in session.tasks
+            ],
+        )
+        for session in corpus.sessions.values()
+    ]
+
+
 @pytest.fixture
 def sample_words():
     return [
@@ -61,7 +295,7 @@ def sample_turns(sample_ipus):
         Turn(
             session_id=1,
             task_id=1,
-            ipu_ids=[sample_ipus[0].ipu_id],
+            ipus=[sample_ipus[0]],
             speaker="A",
             start=0.0,
             end=1.0,
@@ -69,7 +303,7 @@ def sample_turns(sample_ipus):
         Turn(
             session_id=1,
             task_id=1,
-            ipu_ids=[sample_ipus[1].ipu_id],
+            ipus=[sample_ipus[1]],
             speaker="B",
             start=2.0,
             end=3.0,
@@ -92,13 +326,13 @@ def sample_task(sample_ipus, sample_turns):
         turn_transitions=[
             TurnTransition(
                 label="X1",
-                turn_id_from=None,  # First turn has no previous turn
-                turn_id_to=sample_turns[0].turn_id,
+                turn_from=None,  # First turn has no previous turn
+                turn_to=sample_turns[0],
             ),
             TurnTransition(
                 label="BC",
-                turn_id_from=sample_turns[0].turn_id,
-                turn_id_to=sample_turns[1].turn_id,
+                turn_from=sample_turns[0],
+                turn_to=sample_turns[1],
             ),
         ],
         turns=sample_turns,
@@ -154,6 +388,17 @@ class TestIPU:
         assert ipu.text == "hello world"
         assert ipu.num_words == 2
 
+    def test_ipu_text_is_lazy(self, sample_words):
+        ipu = IPU(words=sample_words)
+        assert ipu._text is None
+        assert ipu.text is ipu.text
+        assert ipu._text == "hello world"
+
+    def test_ids_are_formatted_once(self, sample_ipus, sample_turns):
+        ipu, turn = sample_ipus[0], sample_turns[0]
+        assert ipu.ipu_id is ipu.ipu_id == "ipu_A_0.00_1.00"
+        assert turn.turn_id is turn.turn_id == "turn_01_01_A_0.00_1.00"
+
     def test_ipu_representation(self, sample_ipu):
         assert "IPU(words=" in repr(sample_ipu)
         assert "hello" in repr(sample_ipu)
@@ -164,8 +409,8 @@ class TestTurnTransition:
     def test_turn_transition_initialization(self, sample_turns):
         transition = TurnTransition(
             label="BC",
-            turn_id_from=sample_turns[0].turn_id,
-            turn_id_to=sample_turns[1].turn_id,
+            turn_from=sample_turns[0],
+            turn_to=sample_turns[1],
         )
         assert transition.label_type == TurnTransitionType.BACKCHANNEL
         assert transition.transition_duration == 1.0
@@ -176,19 +421,15 @@ class TestTurnTransition:
         overlapped_turn = Turn(
             session_id=1,
             task_id=1,
-            ipu_ids=[
-                IPU(
-                    words=[Word(start=0.5, end=1.5, text="overlap", speaker="B")]
-                ).ipu_id
-            ],
+            ipus=[IPU(words=[Word(start=0.5, end=1.5, text="overlap", speaker="B")])],
             speaker="B",
             start=0.5,
             end=1.5,
         )
         transition = TurnTransition(
             label="O",
-            turn_id_from=sample_turns[0].turn_id,
-            turn_id_to=overlapped_turn.turn_id,
+            turn_from=sample_turns[0],
+            turn_to=overlapped_turn,
         )
         assert transition.overlapped_transition
 
@@ -203,7 +444,7 @@ class TestTurnTransition:
                 # Get all X3 transitions
                 x3_transitions = [t for t in task.turn_transitions if t.label == "X3"]
                 for trans in x3_transitions:
-                    to_turn = Turn.get_turn_by_id(trans.turn_id_to)
+                    to_turn = trans.turn_to
                     interlocutor_previous_turn = [
                         t for t in task.turns
                         if t.speaker != to_turn.speaker
@@ -237,6 +478,11 @@ class TestTurn:
         turn = sample_turns[0]
         assert Turn.get_turn_by_id(turn.turn_id) == turn
 
+    def test_turn_holds_ipu_references(self, sample_ipus, sample_turns):
+        IPU.clear_registry()
+        assert sample_turns[0].ipus[0] is sample_ipus[0]
+        assert sample_turns[0].ipu_ids == [sample_ipus[0].ipu_id]
+
     def test_turn_definition_correctness(self):
         """Verify that turns follow the definition: maximal sequence of IPUs without interlocutor speech during silences."""
         corpus = SpanishGamesCorpusDialogues()
@@ -247,7 +493,7 @@ class TestTurn:
                 all_ipus = sorted(task.ipus, key=lambda x: x.start)
                 
                 for turn in task.turns:
-                    turn_ipus = sorted([IPU.get_ipu_by_id(ipu_id) for ipu_id in turn.ipu_ids], key=lambda x: x.start)
+                    turn_ipus = sorted(turn.ipus, key=lambda x: x.start)
                     if len(turn_ipus) <= 1:
                         continue
                         
@@ -329,6 +575,12 @@ class TestTask:
         expected_text = "\n\t[IPU (A) 0.00:1.00 ] hello\n\t[IPU (B) 2.00:3.00 ] world"
         assert sample_task.text == expected_text
 
+    def test_task_previous_turn(self, sample_task, sample_turns):
+        assert sample_task.previous_turn("A", before=2.5) == sample_turns[0]
+        assert sample_task.previous_turn("B", before=2.5) == sample_turns[1]
+        assert sample_task.previous_turn("B", before=1.9) is None
+        assert sample_task.previous_turn("C", before=2.5) is None
+
     def test_task_repr(self, sample_task):
         expected = "[Task 01 (A) 0.00:10.00 ] Turns 2 IPUs 2"
         assert repr(sample_task) == expected
@@ -343,7 +595,7 @@ class TestTask:
             Turn(
                 session_id=1,
                 task_id=2,
-                ipu_ids=[sample_ipus[0].ipu_id],
+                ipus=[sample_ipus[0]],
                 speaker="A",
                 start=0.0,
                 end=1.0,
@@ -388,6 +640,181 @@ class TestTask:
         assert len(task.ipus) == 0
         assert task.text == ""
 
+    def test_task_audio(self, sample_task, tmp_path):
+        np = pytest.importorskip("numpy")
+        samplerate = 100
+        add_sample_wavs(sample_task, tmp_path, samplerate)
+
+        ipu = sample_task.ipus[1]
+        assert ipu.task is sample_task
+        assert ipu.audio().tolist() == list(range(200, 300))
+        assert isinstance(ipu.audio().base, np.memmap)
+        assert sample_task.turns[0].audio("B").tolist() == list(range(0, 100))
+        assert len(sample_task.audio("A")) == 1000
+        assert sample_task.audio("A", sr=samplerate).dtype == np.float32
+
+
+class TestResampledAudio:
+    def test_written_wavs_are_memory_mapped(self, tmp_path):
+        np = pytest.importorskip("numpy")
+        samples = np.linspace(-1, 1, 20, dtype=np.float32).reshape(10, 2)
+        write_wav(tmp_path / "stereo.wav", samples, 8000)
+
+        wav = WavFile.open(tmp_path / "stereo.wav")
+        assert wav.samplerate == 8000
+        assert isinstance(wav.samples, np.memmap)
+        assert wav.samples.tolist() == samples.tolist()
+
+    def test_rewritten_wavs_are_reopened(self, tmp_path):
+        np = pytest.importorskip("numpy")
+        path = tmp_path / "A.wav"
+        write_wav(path, np.zeros(10, dtype=np.int16), 100)
+        assert games_corpus_audio.open_wav(path).samples.tolist() == [0] * 10
+
+        write_wav(path, np.ones(20, dtype=np.int16), 100)
+        os.utime(path, ns=(0, path.stat().st_mtime_ns + 1))
+        assert games_corpus_audio.open_wav(path).samples.tolist() == [1] * 20
+
+    def test_existing_copies_are_reused(self, sample_task, tmp_path):
+        np = pytest.importorskip("numpy")
+        add_sample_wavs(sample_task, tmp_path / "wavs")
+        path = sample_task.wavs["B"]
+        copy_path = resampled_path(path, 50)
+        assert copy_path == tmp_path / "resampled" / "50hz-int16" / "wavs" / "B.wav"
+        copy_path.parent.mkdir(parents=True)
+        write_wav(copy_path, np.arange(500, dtype=np.int16) * 2, 50)
+
+        # Copies on disk are read without resampling, as in a later run
+        assert sample_task.ipus[1].audio(sr=50).tolist() == pytest.approx(
+            [2 * i / 32768 for i in range(100, 150)]
+        )
+        assert resample_wav(path, 50) == copy_path
+        # Reads at the wav's own rate still use the wav
+        assert sample_task.ipus[1].audio(sr=100)[0] == pytest.approx(200 / 32768)
+
+        # float32 copies are preferred, whichever was made last
+        float_path = resampled_path(path, 50, "float32")
+        float_path.parent.mkdir(parents=True)
+        write_wav(float_path, np.full(500, 0.5, dtype=np.float32), 50)
+        assert resample_wav(path, 50, "int16") == copy_path
+        assert sample_task.ipus[1].audio(sr=50)[0] == 0.5
+
+    def test_invalid_dtype(self, tmp_path):
+        with pytest.raises(ValueError, match="Invalid dtype"):
+            resample_wav(tmp_path / "A.wav", 16000, dtype="int8")
+
+
+class TestTransitionWindows:
+    def test_windows_around_switches(self, sample_task, tmp_path):
+        np = pytest.importorskip("numpy")
+        add_sample_wavs(sample_task, tmp_path)
+
+        windows = sample_task.transition_windows(before=0.5, after=0.2)
+        # The first turn has no switch to anchor a window to
+        assert windows.transitions == sample_task.turn_transitions[1:]
+        assert windows.labels.tolist() == ["BC"]
+        assert windows.label_types == [TurnTransitionType.BACKCHANNEL]
+        assert windows.channels == ("A", "B")
+        assert windows.audio.shape == (1, 2, 70)
+        assert windows.boundary == 50
+        expected = np.r_[50:100, 200:220] / 32768
+        assert windows.audio[0, 0].tolist() == pytest.approx(expected.tolist())
+        assert windows.audio[0, 1].tolist() == pytest.approx(expected.tolist())
+
+    def test_windows_outside_the_audio_are_zeros(self, sample_task, tmp_path):
+        pytest.importorskip("numpy")
+        add_sample_wavs(sample_task, tmp_path)
+
+        windows = sample_task.transition_windows(before=2.0, after=8.5)
+        assert windows.audio.shape == (1, 2, 1050)
+        assert (windows.audio[0, :, :100] == 0).all()
+        assert (windows.audio[0, :, 100:300] != 0).any()
+        assert (windows.audio[0, :, 1000:] == 0).all()
+
+    def test_columnar_tasks(self, sample_corpus_path, tmp_path):
+        pytest.importorskip("numpy")
+        windows = {}
+        for columnar in (False, True):
+            corpus = SpanishGamesCorpusDialogues()
+            corpus.load(local_path=sample_corpus_path, columnar=columnar)
+            for session in corpus.sessions.values():
+                for task in session.tasks:
+                    add_sample_wavs(task, tmp_path / "wavs")
+            windows[columnar] = corpus.transition_windows(before=0.5, after=0.5)
+
+        assert len(windows[True].transitions) > 0
+        assert windows[True].labels.tolist() == windows[False].labels.tolist()
+        assert windows[True].audio.tolist() == windows[False].audio.tolist()
+
+    def test_other_rates_need_resampled_wavs(self, sample_task, tmp_path):
+        pytest.importorskip("numpy")
+        add_sample_wavs(sample_task, tmp_path)
+        with pytest.raises(ValueError, match="resample it to 16000 Hz first"):
+            sample_task.transition_windows(sr=16000)
+
+
+class TestAudioBatches:
+    def test_batches_group_similar_durations(self):
+        durations = [0.2, 3.0, 0.3, 3.2, 0.25, 3.1]
+        units = [SimpleNamespace(start=0.0, end=d) for d in durations]
+        batches = plan_batches(units, batch_size=3, bucket_width=0.5)
+        assert [[u.end for u in b] for b in batches] == [
+            [0.2, 0.3, 0.25],
+            [3.0, 3.2, 3.1],
+        ]
+
+        shuffled = plan_batches(units, 3, 0.5, shuffle=True, seed=1)
+        assert sorted(map(len, shuffled)) == [3, 3]
+        for batch in shuffled:
+            assert max(u.end - u.start for u in batch) < 2 * min(
+                u.end - u.start for u in batch
+            )
+
+    def test_batches_are_padded(self, sample_task, tmp_path):
+        np = pytest.importorskip("numpy")
+        add_sample_wavs(sample_task, tmp_path)
+        sample_task.ipus[1].end = 2.5
+
+        (batch,) = audio_batches(sample_task.ipus, sr=100, batch_size=2)
+        # The shorter IPU is in a shorter duration bucket
+        assert batch.units == sample_task.ipus[::-1]
+        assert batch.audio.dtype == np.float32
+        assert batch.audio.flags["C_CONTIGUOUS"]
+        assert batch.audio.shape == (2, 100)
+        assert batch.lengths.tolist() == [50, 100]
+        assert batch.mask.sum(axis=1).tolist() == [50, 100]
+        assert (batch.audio[0, 50:] == 0).all()
+        assert batch.audio[0, 0] == pytest.approx(200 / 32768)
+
+
+class TestVadMatrix:
+    def test_ipus_are_rasterized(self, sample_task):
+        pytest.importorskip("numpy")
+        vad = sample_task.vad_matrix(frame_hz=10)
+        assert vad.shape == (2, 100)
+        assert vad.dtype == bool
+        assert vad[0].nonzero()[0].tolist() == list(range(0, 10))
+        assert vad[1].nonzero()[0].tolist() == list(range(20, 30))
+        # Cached per frame rate
+        assert sample_task.vad_matrix(frame_hz=10) is vad
+        assert not vad.flags.writeable and vad.base is None
+        assert sample_task.vad_matrix(frame_hz=4).shape == (2, 40)
+
+    def test_corpus_matrices_match_per_task_ones(self, sample_corpus_path):
+        pytest.importorskip("numpy")
+        objects = SpanishGamesCorpusDialogues()
+        objects.load(local_path=sample_corpus_path)
+        corpus = SpanishGamesCorpusDialogues()
+        corpus.load(local_path=sample_corpus_path, columnar=True)
+
+        matrices = corpus.vad_matrices(frame_hz=20)
+        tasks = [task for s in objects.sessions.values() for task in s.tasks]
+        assert len(matrices) == len(tasks)
+        for (task, vad), expected in zip(matrices, tasks):
+            assert task.vad_matrix(frame_hz=20) is vad
+            assert vad.tolist() == expected.vad_matrix(frame_hz=20).tolist()
+            assert vad.any()
+
 
 class TestLoadTasksInfo:
     def test_load_tasks_info_batch1(self, sample_task_file):
@@ -398,6 +825,82 @@ class TestLoadTasksInfo:
         assert float(tasks[0]["Score"]) == 1.0
 
 
+class TestLoadIpusFromWords:
+    def test_load_ipus_from_words(self, sample_words_folder):
+        ipus = load_ipus_from_words(1, (0.0, 5.0), sample_words_folder)
+        assert [ipu.text for ipu in ipus] == ["hola che", "mono arriba", "sí"]
+
+    def test_session_split_by_task(self, sample_words_folder):
+        tasks_boundaries = [(0.0, 5.0), (4.2, 9.5), (20.0, 30.0)]
+        ipus_by_task = load_ipus_from_words_for_session(
+            1, tasks_boundaries, sample_words_folder
+        )
+        assert [[ipu.text for ipu in ipus] for ipus in ipus_by_task] == [
+            ["hola che", "mono arriba", "sí"],
+            ["mono arriba", "bien"],
+            [],
+        ]
+
+
+class TestFindTurnIpus:
+    def test_index_matches_linear_scan(self):
+        ipus = [
+            IPU(words=[Word(start=t0, end=tf, text="x", speaker="A")])
+            for t0, tf in [
+                (0.0, 1.0),
+                (1.05, 1.5),
+                (2.0, 2.5),
+                (3.0, 6.0),
+                (9.95, 11.0),
+            ]
+        ]
+        index = IntervalIndex(ipus)
+        for turn_start, turn_end in [(0.0, 1.5), (1.1, 2.4), (3.5, 4.0), (7.0, 9.9)]:
+            assert find_turn_ipus(index, turn_start, turn_end) == find_turn_ipus(
+                ipus, turn_start, turn_end
+            )
+        assert find_turn_ipus(index, 0.0, 1.5) == ipus[:2]
+        assert find_turn_ipus(index, 7.0, 9.9) == [ipus[4]]
+        assert find_turn_ipus(index, 3.5, 4.0) == []
+
+
+class TestLoadTurns:
+    def test_turns_lines_split_by_task(self, sample_turns_folder):
+        tasks_info = [
+            {"Task ID": 1, "Start": 0.0, "End": 3.8},
+            {"Task ID": 2, "Start": 4.2, "End": 9.5},
+        ]
+        turns_lines = list(
+            iter_turns_lines_for_session(1, tasks_info, sample_turns_folder, 1)
+        )
+        assert [(t0, tf, label) for t0, tf, label in turns_lines[0]["B"]] == [
+            (0.0, 3.0, "#"),
+            (3.0, 3.5, "BC"),
+            (3.5, 9.5, "#"),
+        ]
+        assert [label for _, _, label in turns_lines[1]["A"]] == ["S", "#"]
+
+    def test_shared_turns_lines(self, sample_words_folder, sample_turns_folder):
+        task_boundaries = (0.0, 9.5, 1, 1)
+        ipus = load_ipus_from_words(1, task_boundaries, sample_words_folder)
+        turns_lines = next(
+            iter_turns_lines_for_session(
+                1, [{"Task ID": 1, "Start": 0.0, "End": 9.5}], sample_turns_folder, 1
+            )
+        )
+
+        from_folder = load_turns_for_task(
+            1, 1, sample_turns_folder, 1, ipus, task_boundaries
+        )
+        from_lines = load_turns_for_task(
+            1, 1, {}, 1, ipus, task_boundaries, turns_lines=turns_lines
+        )
+        assert [turn.turn_id for turn in from_lines] == [
+            turn.turn_id for turn in from_folder
+        ]
+        assert len(from_lines) == 3
+
+
 class TestSpanishGamesCorpusDialogues:
     def test_initialization(self):
         corpus = SpanishGamesCorpusDialogues()
@@ -415,6 +918,315 @@ class TestSpanishGamesCorpusDialogues:
         assert len(batch1_sessions) == 1
         assert 1 in batch1_sessions
 
+    def test_load_local_corpus(self, sample_corpus_path):
+        corpus = SpanishGamesCorpusDialogues()
+        corpus.load(local_path=sample_corpus_path)
+
+        assert sorted(corpus.sessions) == [1, 15]
+        assert [len(session.tasks) for session in corpus.sessions.values()] == [2, 2]
+        b1_task = corpus.sessions[1].tasks[0]
+        assert [t.label for t in b1_task.turn_transitions] == ["X1", "BC", "S"]
+        b2_task = corpus.sessions[15].tasks[1]
+        assert [t.label for t in b2_task.turn_transitions] == ["X1", "O"]
+
+    def test_parallel_load_matches_serial(self, sample_corpus_path):
+        serial = SpanishGamesCorpusDialogues()
+        serial.load(local_path=sample_corpus_path)
+        expected = corpus_summary(serial)
+
+        IPU.clear_registry()
+        Turn.clear_registry()
+        parallel = SpanishGamesCorpusDialogues()
+        parallel.load(local_path=sample_corpus_path, workers=2)
+
+        assert corpus_summary(parallel) == expected
+        for session in parallel.sessions.values():
+            for task in session.tasks:
+                for turn in task.turns:
+                    assert Turn.get_turn_by_id(turn.turn_id) is turn
+                    assert all(ipu is not None for ipu in turn.ipus)
+
+    def test_load_from_cache(self, sample_corpus_path, monkeypatch):
+        corpus = SpanishGamesCorpusDialogues()
+        corpus.load(local_path=sample_corpus_path, use_cache=True)
+        expected = corpus_summary(corpus)
+        assert corpus.cache_path.exists()
+
+        def fail_parse(self, workers=None):
+            raise AssertionError("corpus should be read from the cache")
+
+        monkeypatch.setattr(SpanishGamesCorpusDialogues, "_parse_corpus", fail_parse)
+        Turn.clear_registry()
+        cached = SpanishGamesCorpusDialogues()
+        cached.load(local_path=sample_corpus_path, use_cache=True)
+
+        assert corpus_summary(cached) == expected
+        turn = cached.sessions[1].tasks[0].turns[0]
+        assert Turn.get_turn_by_id(turn.turn_id) is turn
+
+    def test_cache_invalidated_by_changed_files(self, sample_corpus_path):
+        corpus = SpanishGamesCorpusDialogues()
+        corpus.load(local_path=sample_corpus_path, use_cache=True)
+
+        tasks_file = sample_corpus_path / "b2-dialogue-tasks/s15.objects.tasks"
+        tasks_file.write_text(
+            "1 Images:img1,img2;Describer:A;Target:img1;Score:1.0;Time-used:5.0\n"
+        )
+        reloaded = SpanishGamesCorpusDialogues()
+        reloaded.load(local_path=sample_corpus_path, use_cache=True)
+
+        assert len(reloaded.sessions[15].tasks) == 1
+
+    def test_stale_cache_sessions_are_not_read(self, sample_corpus_path, caplog):
+        corpus = SpanishGamesCorpusDialogues()
+        corpus.load(local_path=sample_corpus_path)
+        # Sessions that cannot be unpickled behind an outdated key
+        with open(corpus.cache_path, "wb") as f:
+            pickle.dump(("outdated",), f)
+            f.write(b"not a pickle")
+
+        with caplog.at_level(logging.INFO):
+            corpus.load(local_path=sample_corpus_path, use_cache=True)
+        assert "cache is out of date" in caplog.text
+        assert "unreadable cache" not in caplog.text
+        assert len(corpus.sessions[15].tasks) == 2
+
+    def test_lazy_load(self, sample_corpus_path):
+        eager = SpanishGamesCorpusDialogues()
+        eager.load(local_path=sample_corpus_path)
+
+        corpus = SpanishGamesCorpusDialogues()
+        corpus.load(local_path=sample_corpus_path, lazy=True)
+        assert sorted(corpus.sessions) == [1, 15]
+        assert corpus.sessions.loaded_session_ids == []
+
+        assert len(list(corpus.dev_tasks(batch=2))) == 2
+        assert corpus.sessions.loaded_session_ids == [15]
+        session = corpus.sessions[15]
+        assert corpus.sessions[15] is session
+
+        assert corpus_summary(corpus) == corpus_summary(eager)
+
+    def test_load_from_zip(self, sample_corpus_path, tmp_path):
+        extracted = SpanishGamesCorpusDialogues()
+        extracted.load(local_path=sample_corpus_path)
+
+        zipped_path = tmp_path / "zipped"
+        zipped_path.mkdir()
+        for path in sample_corpus_path.iterdir():
+            if path.is_dir():
+                with zipfile.ZipFile(zipped_path / f"{path.name}.zip", "w") as z:
+                    for member in sorted(path.iterdir()):
+                        z.write(member, f"{path.name}/{member.name}")
+            else:
+                shutil.copy(path, zipped_path / path.name)
+
+        corpus = SpanishGamesCorpusDialogues()
+        corpus.load(local_path=zipped_path, from_zip=True)
+        assert not (zipped_path / "b1-dialogue-words").exists()
+        assert corpus_summary(corpus) == corpus_summary(extracted)
+
+        archives = list(games_corpus_parsers._open_archives.values())
+        assert {Path(a.filename) for a in archives} == corpus.zip_archives
+        # Reloading closes the archives of the previous load
+        corpus.load(local_path=zipped_path, from_zip=True, lazy=True)
+        assert all(archive.fp is None for archive in archives)
+        corpus.close_archives()
+        assert games_corpus_parsers._open_archives == {}
+
+    def test_selective_load(self, sample_corpus_path):
+        full = SpanishGamesCorpusDialogues()
+        full.load(local_path=sample_corpus_path)
+        expected = full.sessions[15].tasks
+
+        corpus = SpanishGamesCorpusDialogues()
+        corpus.load(local_path=sample_corpus_path, sessions=[15], tiers=["ipus"])
+        assert list(corpus.sessions) == [15]
+        assert "b2-dialogue-turns" not in corpus.corpus_files
+        assert [len(task.ipus) for task in corpus.sessions[15].tasks] == [
+            len(task.ipus) for task in expected
+        ]
+        assert all(not task.turns for task in corpus.sessions[15].tasks)
+
+        # Archives of other batches are not needed
+        for folder in sample_corpus_path.glob("b1-*"):
+            shutil.rmtree(folder)
+        corpus = SpanishGamesCorpusDialogues()
+        corpus.load(local_path=sample_corpus_path, batches=[2], tiers=["turns"])
+        assert list(corpus.sessions) == [15]
+        assert list(corpus.dev_tasks(batch=1)) == []
+        tasks = list(corpus.dev_tasks(batch=2))
+        assert [task.task_id for task in tasks] == [1, 2]
+        assert [len(task.turns) for task in tasks] == [len(t.turns) for t in expected]
+        assert all(task.ipus and not task.turn_transitions for task in tasks)
+
+    def test_selected_sessions_only_fetch_their_batch(
+        self, sample_corpus_path, file_server
+    ):
+        for folder in sample_corpus_path.glob("b1-*"):
+            shutil.rmtree(folder)
+        corpus = SpanishGamesCorpusDialogues()
+        corpus.load(url=file_server.url, local_path=sample_corpus_path, sessions=[15])
+        assert file_server.requests == []
+        assert corpus.batches == {2}
+        assert list(corpus.sessions) == [15]
+
+    def test_batch1_phrases_are_not_fetched(self, sample_corpus_path, file_server):
+        shutil.rmtree(sample_corpus_path / "b1-dialogue-phrases")
+        corpus = SpanishGamesCorpusDialogues()
+        corpus.load(
+            url=file_server.url,
+            local_path=sample_corpus_path,
+            batches=[1],
+            tiers=["ipus"],
+        )
+        assert file_server.requests == []
+        assert "b1-dialogue-phrases" not in corpus.corpus_files
+        assert [len(task.ipus) for task in corpus.sessions[1].tasks] == [3, 2]
+
+    def test_wider_selection_after_narrow_load(self, sample_corpus_path):
+        full = SpanishGamesCorpusDialogues()
+        full.load(local_path=sample_corpus_path)
+
+        corpus = SpanishGamesCorpusDialogues()
+        corpus.load(local_path=sample_corpus_path, batches=[1], tiers=["ipus"])
+        corpus.load(local_path=sample_corpus_path, batches=[2])
+        assert set(corpus.sessions) == set(full.get_sessions_by_batch(2))
+        corpus.load(local_path=sample_corpus_path)
+        assert corpus_summary(corpus) == corpus_summary(full)
+
+    def test_selective_load_invalid_tier(self, sample_corpus_path):
+        corpus = SpanishGamesCorpusDialogues()
+        with pytest.raises(ValueError, match="Invalid tiers"):
+            corpus.load(local_path=sample_corpus_path, tiers=["words"])
+
+    def test_audio_on_demand(self, sample_corpus_path, file_server):
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, "w") as z:
+            for name in ["s01.objects.1.A.wav", "s01.objects.1.B.wav"]:
+                z.writestr(f"b1-dialogue-wavs/{name}", name.encode() * 1000)
+        file_server.files = {"b1-dialogue-wavs.zip": archive.getvalue()}
+
+        corpus = SpanishGamesCorpusDialogues()
+        corpus.load(
+            url=file_server.url,
+            local_path=sample_corpus_path,
+            load_audio="on_demand",
+            batches=[1],
+        )
+        assert file_server.requests == []
+        wavs = corpus.sessions[1].tasks[0].wavs
+        assert wavs["A"] == sample_corpus_path / "b1-dialogue-wavs" / (
+            "s01.objects.1.A.wav"
+        )
+        assert wavs["B"].read_bytes() == b"s01.objects.1.B.wav" * 1000
+        assert not (sample_corpus_path / "b1-dialogue-wavs.zip").exists()
+        assert all(range_header for _, range_header in file_server.requests)
+
+        # Extracted files are reused
+        file_server.requests.clear()
+        assert dict(corpus.sessions[1].tasks[1].wavs) == dict(wavs)
+        assert file_server.requests == []
+
+    def test_audio_archives_are_shared_across_processes(
+        self, sample_corpus_path, file_server
+    ):
+        options = dict(
+            url=file_server.url,
+            local_path=sample_corpus_path,
+            load_audio="on_demand",
+            batches=[1],
+        )
+        for load_options in ({"workers": 2, "use_cache": True}, {"use_cache": True}):
+            corpus = SpanishGamesCorpusDialogues()
+            corpus.load(**options, **load_options)
+            archive = corpus.audio_archives["b1-dialogue-wavs"]
+            for task in corpus.sessions[1].tasks:
+                assert task.wavs.archive is archive
+
+    def test_iter_tasks(self, sample_corpus_path):
+        corpus = SpanishGamesCorpusDialogues()
+        corpus.load(local_path=sample_corpus_path, lazy=True)
+
+        seen = []
+        for task in corpus.iter_tasks(batch=1, split="dev"):
+            assert all(
+                turn.registry is not corpus.registry
+                and turn.registry.get_turn_by_id(turn.turn_id) is turn
+                for turn in task.turns
+            )
+            seen.append((task.session_id, task.task_id, len(task.turn_transitions)))
+
+        assert seen == [(1, 1, 3), (1, 2, 2)]
+        assert list(corpus.iter_tasks(batch=2, split="held_out")) == []
+        assert corpus.sessions.loaded_session_ids == []
+        assert corpus.registry.ipus == {}
+        assert corpus.registry.turns == {}
+
+    def test_iter_tasks_keeps_loaded_objects_registered(self, sample_corpus_path):
+        corpus = SpanishGamesCorpusDialogues()
+        corpus.load(local_path=sample_corpus_path)
+        ipus = dict(corpus.registry.ipus)
+        turns = dict(corpus.registry.turns)
+
+        assert len(list(corpus.iter_tasks())) == 4
+        assert corpus.registry.ipus == ipus and corpus.registry.turns == turns
+        turn = corpus.sessions[1].tasks[0].turns[0]
+        assert corpus.get_turn_by_id(turn.turn_id) is turn
+
+        lazy = SpanishGamesCorpusDialogues()
+        lazy.load(local_path=sample_corpus_path, lazy=True)
+        ipu = lazy.sessions[15].tasks[0].ipus[0]
+        list(lazy.iter_tasks())
+        assert lazy.get_ipu_by_id(ipu.ipu_id) is ipu
+
+    def test_iter_tasks_invalid_split(self, sample_corpus_path):
+        corpus = SpanishGamesCorpusDialogues()
+        corpus.load(local_path=sample_corpus_path, lazy=True)
+        with pytest.raises(ValueError):
+            next(corpus.iter_tasks(split="train"))
+
+    def test_corpus_registries(self, sample_corpus_path):
+        first = SpanishGamesCorpusDialogues()
+        first.load(local_path=sample_corpus_path)
+        second = SpanishGamesCorpusDialogues()
+        second.load(local_path=sample_corpus_path)
+
+        turn_id = first.sessions[1].tasks[0].turns[0].turn_id
+        assert first.get_turn_by_id(turn_id) is first.sessions[1].tasks[0].turns[0]
+        assert second.get_turn_by_id(turn_id) is second.sessions[1].tasks[0].turns[0]
+        assert first.get_turn_by_id(turn_id) is not second.get_turn_by_id(turn_id)
+        assert Turn.get_turn_by_id(turn_id) is second.get_turn_by_id(turn_id)
+        assert Session.get_session_by_id(15) is second.sessions[15]
+
+        registry = weakref.ref(second.registry)
+        del second
+        gc.collect()
+        assert registry() is None
+
+    def test_columnar_load(self, sample_corpus_path):
+        pytest.importorskip("numpy")
+        from games_corpus_columnar import transition_durations_by_label
+
+        objects = SpanishGamesCorpusDialogues()
+        objects.load(local_path=sample_corpus_path)
+        corpus = SpanishGamesCorpusDialogues()
+        corpus.load(local_path=sample_corpus_path, columnar=True)
+
+        assert corpus_summary(corpus) == corpus_summary(objects)
+        assert corpus.registry.ipus == {}
+        task = corpus.sessions[1].tasks[0]
+        expected = objects.sessions[1].tasks[0]
+        assert str(task) == str(expected)
+        assert [w.text for w in task.ipus[0].words] == ["hola", "che"]
+        transition = task.turn_transitions[1]
+        assert transition.ipu_from.text == "hola che"
+        assert transition.transition_duration == 1.0
+
+        durations = transition_durations_by_label(corpus.dev_tasks(batch=2))
+        assert sorted(durations) == ["O", "S", "X1"]
+        assert durations["O"].tolist() == pytest.approx([0.2])
+
     def test_batch1_task_distribution(self):
         corpus = SpanishGamesCorpusDialogues()
         corpus.load(load_audio=False)
@@ -589,5 +1401,240 @@ class TestSpanishGamesCorpusDialogues:
         )
 
 
+class TestCorpusDownloader:
+    def test_download_corpus(self, file_server, tmp_path):
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, "w") as z:
+            z.writestr("b1-dialogue-tasks/s01.objects.1.tasks", "tasks")
+        file_server.files = {
+            "b1-dialogue-tasks.zip": archive.getvalue(),
+            "sessions-info.csv": b"session_id,batch\n1,1\n",
+        }
+
+        downloader = CorpusDownloader(file_server.url, tmp_path, retry_delay=0)
+        downloader.download_corpus(
+            {
+                "b1-dialogue-tasks": "b1-dialogue-tasks.zip",
+                "sessions-info": "sessions-info.csv",
+            }
+        )
+
+        assert (tmp_path / "b1-dialogue-tasks" / "s01.objects.1.tasks").exists()
+        assert (tmp_path / "sessions-info.csv").read_bytes() == (
+            file_server.files["sessions-info.csv"]
+        )
+        assert not list(tmp_path.glob("*.part"))
+
+    def test_download_resumes_interrupted_file(self, file_server, tmp_path):
+        content = bytes(range(256)) * 64
+        file_server.files = {"big.bin": content}
+        file_server.drop_after = {"big.bin": 1000}
+
+        downloader = CorpusDownloader(
+            file_server.url, tmp_path, retry_delay=0, chunk_size=100
+        )
+        downloader.download_corpus({"big": "big.bin"})
+
+        assert (tmp_path / "big.bin").read_bytes() == content
+        assert file_server.requests == [("big.bin", None), ("big.bin", "bytes=1000-")]
+
+    def test_failed_download_keeps_partial_file(self, file_server, tmp_path):
+        file_server.files = {"big.bin": b"x" * 500}
+        file_server.drop_after = {"big.bin": 200}
+
+        downloader = CorpusDownloader(
+            file_server.url, tmp_path, max_retries=1, retry_delay=0, chunk_size=100
+        )
+        with pytest.raises(RuntimeError):
+            downloader.download_corpus({"big": "big.bin"})
+        assert not (tmp_path / "big.bin").exists()
+        assert (tmp_path / "big.bin.part").stat().st_size == 200
+
+    @pytest.fixture
+    def served_corpus(self, file_server):
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, "w") as z:
+            z.writestr("b1-dialogue-tasks/s01.objects.1.tasks", "tasks " * 100)
+        file_server.files = {
+            "b1-dialogue-tasks.zip": archive.getvalue(),
+            "sessions-info.csv": b"session_id,batch\n1,1\n",
+        }
+        return {
+            "b1-dialogue-tasks": "b1-dialogue-tasks.zip",
+            "sessions-info": "sessions-info.csv",
+        }
+
+    def test_corrupt_files_are_downloaded_again(
+        self, file_server, served_corpus, tmp_path
+    ):
+        csv_content = file_server.files["sessions-info.csv"]
+        checksums = {
+            "sessions-info.csv": FileChecksum(
+                len(csv_content), hashlib.sha256(csv_content).hexdigest()
+            )
+        }
+        (tmp_path / "sessions-info.csv").write_bytes(b"session_id,batch\n2,1\n")
+        (tmp_path / "b1-dialogue-tasks.zip").write_bytes(
+            file_server.files["b1-dialogue-tasks.zip"][:100]
+        )
+
+        downloader = CorpusDownloader(
+            file_server.url, tmp_path, retry_delay=0, checksums=checksums
+        )
+        downloader.download_corpus(served_corpus)
+
+        assert (tmp_path / "sessions-info.csv").read_bytes() == csv_content
+        tasks_file = tmp_path / "b1-dialogue-tasks" / "s01.objects.1.tasks"
+        assert tasks_file.read_text() == "tasks " * 100
+        assert sorted(name for name, _ in file_server.requests) == sorted(
+            served_corpus.values()
+        )
+
+    def test_incomplete_extraction_is_redone(
+        self, file_server, served_corpus, tmp_path
+    ):
+        downloader = CorpusDownloader(file_server.url, tmp_path, retry_delay=0)
+        downloader.download_corpus(served_corpus)
+        tasks_file = tmp_path / "b1-dialogue-tasks" / "s01.objects.1.tasks"
+        tasks_file.write_text("tasks")
+        (tmp_path / "verified-downloads.json").unlink()
+
+        downloader = CorpusDownloader(file_server.url, tmp_path, retry_delay=0)
+        downloader.download_corpus(served_corpus)
+
+        assert tasks_file.read_text() == "tasks " * 100
+        assert len(file_server.requests) == 2
+
+    def test_verified_files_are_not_hashed_again(
+        self, file_server, served_corpus, tmp_path, monkeypatch
+    ):
+        downloader = CorpusDownloader(file_server.url, tmp_path, retry_delay=0)
+        downloader.download_corpus(served_corpus)
+
+        def fail(*args, **kwargs):
+            raise AssertionError("Recorded files must not be hashed again")
+
+        monkeypatch.setattr(games_corpus, "sha256_file", fail)
+        downloader = CorpusDownloader(file_server.url, tmp_path, retry_delay=0)
+        downloader.download_corpus(served_corpus)
+        assert len(file_server.requests) == 2
+
+
+class TestFeatureStore:
+    @pytest.fixture
+    def counting_extractor(self):
+        features = pytest.importorskip("games_corpus_features")
+        calls = []
+
+        @features.register_extractor("test_mean")
+        def mean(samples, sr, scale=1):
+            calls.append(len(samples))
+            return samples.mean(keepdims=True) * scale * sr
+
+        yield features, calls
+        del features.EXTRACTORS["test_mean"]
+
+    def test_features_are_stored(self, counting_extractor, sample_task, tmp_path):
+        features, calls = counting_extractor
+        add_sample_wavs(sample_task, tmp_path)
+        store = features.FeatureStore(tmp_path / "features")
+        extractor = features.FeatureExtractor.create("test_mean", scale=2)
+
+        first = store.task_features(extractor, sample_task, units="ipu")
+        assert calls == [100, 100]
+        assert first[1].tolist() == pytest.approx([249.5 / 32768 * 2 * 100])
+
+        second = store.task_features(extractor, sample_task, units="ipu")
+        assert calls == [100, 100]
+        assert [f.tolist() for f in second] == [f.tolist() for f in first]
+
+        other = features.FeatureExtractor.create("test_mean", scale=3)
+        assert other.key != extractor.key
+        store.task_features(other, sample_task, units="turn")
+        assert len(calls) == 4
+
+    def test_least_recently_used_chunks_are_evicted(
+        self, counting_extractor, sample_task, tmp_path
+    ):
+        features, calls = counting_extractor
+        add_sample_wavs(sample_task, tmp_path)
+        store = features.FeatureStore(tmp_path / "features")
+        extractor = features.FeatureExtractor.create("test_mean")
+
+        store.task_features(extractor, sample_task, units="ipu")
+        ipu_chunk = store.chunk_path(extractor, sample_task, "ipu")
+        store.max_bytes = ipu_chunk.stat().st_size
+        store.task_features(extractor, sample_task, units="turn")
+
+        assert not ipu_chunk.exists()
+        assert store.chunk_path(extractor, sample_task, "turn").exists()
+
+    def test_parallel_extraction_matches_serial(
+        self, counting_extractor, sample_task, tmp_path
+    ):
+        features, calls = counting_extractor
+        add_sample_wavs(sample_task, tmp_path)
+        corpus = SpanishGamesCorpusDialogues()
+        corpus.sessions = {1: Session(1, 1, "A", "B", [sample_task])}
+        corpus.feature_store = features.FeatureStore(tmp_path / "features")
+        extractor = features.FeatureExtractor.create("test_mean")
+
+        parallel = list(corpus.extract_features(extractor, units="turn", workers=2))
+        # Computed and stored by the workers
+        assert calls == []
+        serial = list(corpus.extract_features(extractor, units="turn"))
+        assert calls == []
+
+        assert [unit for unit, _ in parallel] == sample_task.turns
+        assert [f.tolist() for _, f in parallel] == [f.tolist() for _, f in serial]
+
+    def test_stopping_early_cancels_pending_sessions(
+        self, counting_extractor, sample_task, sample_ipus, tmp_path
+    ):
+        features, _ = counting_extractor
+        add_sample_wavs(sample_task, tmp_path)
+
+        @features.register_extractor("test_slow")
+        def slow(samples, sr):
+            time.sleep(0.2)
+            return samples[:1]
+
+        corpus = SpanishGamesCorpusDialogues()
+        corpus.sessions = {}
+        for session_id in range(1, 9):
+            task = Task(
+                task_id=1,
+                session_id=session_id,
+                start=0.0,
+                duration=10.0,
+                images=[],
+                describer="A",
+                target="",
+                score="0",
+                time_used=10.0,
+                turn_transitions=[],
+                turns=[],
+                ipus=sample_ipus,
+                wavs=sample_task.wavs,
+            )
+            corpus.sessions[session_id] = Session(session_id, 1, "A", "B", [task])
+        corpus.feature_store = features.FeatureStore(tmp_path / "features")
+        extractor = features.FeatureExtractor.create("test_slow")
+
+        try:
+            extracted = corpus.extract_features(extractor, workers=2)
+            next(extracted)
+            extracted.close()
+        finally:
+            del features.EXTRACTORS["test_slow"]
+        chunks = list((tmp_path / "features").glob("*/*.npz"))
+        assert 1 <= len(chunks) < 8
+
+    def test_unknown_extractor(self):
+        features = pytest.importorskip("games_corpus_features")
+        with pytest.raises(ValueError, match="Unknown extractor"):
+            features.FeatureExtractor.create("nope")
+
+
 if __name__ == "__main__":
     pytest.main([__file__])